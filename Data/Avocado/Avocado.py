@@ -1,10 +1,12 @@
-import matplotlib.pyplot as plt
-import csv
-import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import datasetBuilder as builder
 
 def currencyFormatter(currencyValue):
     """
-    This function takes a decimal value and 
+    This function takes a decimal value and
     normalizes it to be a string representing currency.
     """
     return "${:,.2f}".format(currencyValue)
@@ -13,21 +15,20 @@ csvFile = 'avocado.csv'
 buckets = 20
 selectedRegion = 'TotalUS'
 selectedtype = 'organic'
+columns = ['AveragePrice', 'Total Volume', 'type', 'region']
 
 
-f = open(csvFile, 'r')
-reader = csv.DictReader(f)
-priceList=[]
-for row in reader:
-    region =row['region']
-    type_ = row['type']
-    price = float(row['AveragePrice'])
+maxPrice = None
+minPrice = None
+for (price, numSold, type_, region) in builder.readColumns(csvFile, columns):
+    price = float(price)
     if region == selectedRegion and type_ == selectedtype:
-        priceList.append(price)
-        
+        if maxPrice is None or price > maxPrice:
+            maxPrice = price
+        if minPrice is None or price < minPrice:
+            minPrice = price
+
 # The following paragraph creates a tuple list of price ranges
-maxPrice = max(priceList)
-minPrice = min(priceList)
 priceList=[]
 rangeLow = 1.15
 rangeHigh= 1.15
@@ -40,81 +41,25 @@ for i in range(buckets):
         priceList.append(priceRange)
         rangeLow+= separation
         rangeLow= round(rangeLow, 2)
-f.close()
+priceBuckets = builder.Bucketing(priceList)
 
-dictRegion={}
-dictAllData = {}
-f = open(csvFile, 'r')
-reader = csv.DictReader(f)
-soldDictTotal={}# incluses 2015 - 2018
-soldDictNum ={}
-for row in reader:
-    price = float(row['AveragePrice'])
-    numSold=float(row['Total Volume'])
-    type_ = row['type']
-    region =row['region']
-    date=row['Date']
-    for low, high in priceList:
-        if low<=price and price<high and region == selectedRegion and type_ == selectedtype: # total
-            priceRange=(low, high)
-            soldDictTotal[priceRange]=soldDictTotal.get(priceRange,0)+numSold
-            soldDictNum[priceRange]=soldDictNum.get(priceRange,0)+1
-            xRange = currencyFormatter(low) + ' - ' + currencyFormatter(high)
-            if xRange not in dictAllData:
-                dictAllData[xRange] = []
-            dictAllData[xRange].append(numSold)
-        if date == '2018-03-11' and region == selectedRegion and type_ ==  selectedtype:
-            print(region, type_, numSold)
-            
-f.close()
+# Normalize low & high to double precision and prepend '$'.
+xValues = [currencyFormatter(low) + ' - ' + currencyFormatter(high) for (low, high) in priceList]
+dataset = builder.DatasetBuilder(xValues)
+for (price, numSold, type_, region) in builder.readColumns(csvFile, columns):
+    if region == selectedRegion and type_ == selectedtype: # total
+        bucket = priceBuckets.indexOf(float(price))
+        if bucket is not None:
+            dataset.add(bucket, float(numSold))
 
-    
-xValues=[]
-yValues=[]
-for low, high in priceList:
-    # Normalize low & high to double precision and prepend '$'.
-    xRange = currencyFormatter(low) + ' - ' + currencyFormatter(high)
-    xValues.append(xRange)
-    priceRange=(low, high)
-    try: # denominator can be zero
-        yAverage= soldDictTotal[priceRange]/soldDictNum[priceRange]
-        yValues.append(yAverage)
-    except:
-        yAverage= 0
-        yValues.append(yAverage)
-plt.bar(xValues, yValues)
-plt.xticks(rotation=90)
-plt.grid(alpha=0.3)
-plt.ticklabel_format(style='plain', axis='y') 
-#plt.legend(loc='best')
-#plt.xlim('1.15 - 1.2', '1.95 - 2.0')
 xlabel = 'Price ($)'
 ylabel = 'Average Weekly Num of Sold Avocados'
 title = 'Price vs. Average Weekly Number of Sold Avocados'
-plt.xlabel(xlabel)
-plt.ylabel(ylabel)
-plt.title(title)
-plt.tight_layout()
-plt.savefig('avocado_sales.png')
-plt.show()
-plt.clf()
-
-
-dictionary =    {
-                    'title': title,
-                    'description':'This is data on the average weekly num of avocados' \
-                        ' sold at different prices. Based on your experience, ' \
-                        'shopping for produce, ',
-                    'xVals': xValues,
-                    'yVals': yValues,
-                    'xlabel': xlabel,
-                    'ylabel': ylabel,
-                    'All_sample': dictAllData
-                }
-
-f = open('avocadoFile.json', 'w')
-
-json.dump(dictionary, f)
+description = 'This is data on the average weekly num of avocados' \
+              ' sold at different prices. Based on your experience, ' \
+              'shopping for produce, '
 
-f.close()
+(xVals, yVals) = dataset.write('avocadoFile.json', title, description, xlabel, ylabel)
+dataset.close()
 
+builder.saveBarPlot('avocado_sales.png', xVals, yVals, xlabel, ylabel, title, rotation=90)
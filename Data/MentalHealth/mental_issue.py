@@ -1,6 +1,8 @@
-import matplotlib.pyplot as plt
-import csv
-import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import datasetBuilder as builder
 
 def strMaker(low, high, age_range):
     if (low, high)==age_range[0]:
@@ -26,115 +28,41 @@ for i in range(buckets):
     age_range.append(ageTuple)
     low += span
     low = int(low)
+# The first range also holds the youngest ages, the last one the oldest.
+ageBuckets = builder.Bucketing(age_range, openLow=True, openHigh=True)
 
 csvFile = 'mental-heath-in-tech-2016_20161114.csv'
-f = open(csvFile, 'r', encoding='utf-8')
-reader = csv.DictReader(f)
-
-dictAllData={}
-dictSelfAnswer = {}
-dictDiagnosis = {}
-dictTotal = {}
-for row in reader:
-    age = int(row['What is your age?'])
-    region = row['What country do you work in?']
-    selfAnswer = row['Do you currently have a mental health disorder?']
-    diagnosis = row['Have you been diagnosed with a mental health condition by a medical professional?']
-    condition = row['If so, what condition(s) were you diagnosed with?']
+columns = ['What is your age?',
+           'Have you been diagnosed with a mental health condition by a medical professional?',
+           'If so, what condition(s) were you diagnosed with?']
+
+# Each answer is a sample of 100 (diagnosed with the issue) or 0 (not).
+dataset = builder.DatasetBuilder([strMaker(low, high, age_range) for (low, high) in age_range], typecode='q')
+for (age, diagnosis, condition) in builder.readColumns(csvFile, columns):
+    ageRange = ageBuckets.indexOf(int(age))
     condition = condition.strip()
-    
-    for i in range(len(age_range)):
-        ageRange=age_range[i]
-        (low, high)=age_range[i]
-        isInRange = False
-        if i == 0 and age<high:
-            isInRange = True
-        elif i == len(age_range)-1 and low<=age:
-            isInRange = True
-        elif low<=age and age<high:
-            isInRange = True
-
-        isCondition=False
-        isValid=False
-        if isInRange and diagnosis == 'Yes':
-            if '|' in condition:
-                conditions = condition.split('|')
-                if issue in conditions:
-                    dictDiagnosis[ageRange]=dictDiagnosis.get(ageRange,0)+1
-                    isCondition =True
-            else:
-                if issue in condition:
-                    isCondition = True
-                    dictDiagnosis[ageRange]=dictDiagnosis.get(ageRange,0)+1
-        if isInRange:
-            if diagnosis == 'Yes' and condition:
-                isValid = True
-            elif diagnosis == 'No':
-                isValid = True
-            if isValid:
-                dictTotal[ageRange]=dictTotal.get(ageRange,0)+1
-                xRange=strMaker(low, high, age_range)
-                if xRange not in dictAllData:
-                    dictAllData[xRange]=[]
-                if isCondition:
-                    dictAllData[xRange].append(100)
-                else:
-                    dictAllData[xRange].append(0)
-f.close()
 
-xValues=[]
-yValues=[]
-ageCount=[]
-diagnosisCount=[]
-totalList=[]
-for ageRange in age_range:
-    diagnosis = dictDiagnosis.get(ageRange,0)
-    total = dictTotal.get(ageRange,0)
-    if total>=10:
-        diagnosisCount.append(diagnosis)
-        totalList.append(total)
-
-for low, high in age_range:
-    rangeA = (low, high)
-    diagnosis = dictDiagnosis.get(rangeA,0)
-    total = dictTotal.get(rangeA,0)
-    if total>=10:
-        xRange=strMaker(low, high, age_range)
-        xValues.append(xRange)
-        percentage = 100*diagnosis/total
-        yValues.append(percentage)
-plt.bar(xValues, yValues)
-plt.xticks(rotation=45)
-plt.grid(alpha=0.3)
-plt.ticklabel_format(style='plain', axis='y') 
-plt.xlabel('Age ranges')
-plt.ylabel('Percentage')
-plt.title(title)
-plt.tight_layout()
-plt.savefig('mental_issues_graph.png')
-plt.show()
-plt.clf()
+    isCondition=False
+    isValid=False
+    if diagnosis == 'Yes':
+        if '|' in condition:
+            isCondition = issue in condition.split('|')
+        else:
+            isCondition = issue in condition
+    if diagnosis == 'Yes' and condition:
+        isValid = True
+    elif diagnosis == 'No':
+        isValid = True
+    if isValid:
+        dataset.add(ageRange, 100 if isCondition else 0)
 
 description = 'This data is based on the percentage of certain age groups' \
               'of tech industry workers who suffer from mood disorders. ' \
               'Based on your knowledge of psychology, '
 
-dictionary =    {
-                    'title': title,
-                    'description': description,
-                    'xVals': xValues,
-                    'yVals': yValues,
-                    'xlabel': 'Age Ranges',
-                    'ylabel': 'Percentage',
-                    'All_sample': dictAllData
-                }
-
-
-f = open('mental_illness_file.json', 'w')
-
-json.dump(dictionary, f)
-
-f.close()
-
-
+# Age ranges with fewer than 10 answers are left out.
+(xValues, yValues) = dataset.write('mental_illness_file.json', title, description,
+                                   'Age Ranges', 'Percentage', minSamples=10)
+dataset.close()
 
+builder.saveBarPlot('mental_issues_graph.png', xValues, yValues, 'Age ranges', 'Percentage', title, rotation=45)
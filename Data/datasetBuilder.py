@@ -0,0 +1,215 @@
+# Shared code for the scripts that turn a raw CSV file into a dataset
+# for DataDrivenEnv (see Avocado/Avocado.py for an example).
+#
+# Source files are streamed row by row, samples are assigned to their x value
+# (bucket) with a binary search, and the samples gathered so far are spilled
+# to temporary files on disk whenever more than maxBufferedSamples of them are
+# held in memory.  This keeps memory bounded however large the source file is.
+# The dataset is written as the JSON file DataDrivenEnv reads, plus the binary
+# cache it loads in its place.
+#
+# Nothing is displayed: plots are only saved to files (see saveBarPlot).
+
+import array
+import bisect
+import csv
+import json
+import os
+import shutil
+import sys
+import tempfile
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import environments as envs
+
+
+# Yields a tuple of the given columns' values for each row of csvFile, in order.
+def readColumns(csvFile, columns, encoding='utf-8'):
+    with open(csvFile, 'r', encoding=encoding, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        indexes = [header.index(column) for column in columns]
+        for row in reader:
+            yield tuple([row[i] for i in indexes])
+
+
+class Bucketing(object):
+    """
+    Assigns values to buckets [low, high) with a binary search.
+    The buckets must be sorted and must not overlap.
+    With openLow, the first bucket also holds everything below its low end,
+    and with openHigh the last one holds everything above its high end.
+    """
+    def __init__(self, ranges, openLow=False, openHigh=False):
+        self.ranges = list(ranges)
+        self.lows = [low for (low, high) in self.ranges]
+        for i in range(1, len(self.ranges)):
+            if self.ranges[i][0] < self.ranges[i-1][1]:
+                raise ValueError("Buckets overlap: " + str(self.ranges[i-1]) + " and " + str(self.ranges[i]))
+        self.openLow = openLow
+        self.openHigh = openHigh
+
+    def __len__(self):
+        return len(self.ranges)
+
+    # Returns the index of the bucket holding value, or None.
+    def indexOf(self, value):
+        i = bisect.bisect_right(self.lows, value) - 1
+        if i < 0:
+            return 0 if self.openLow else None
+        if value < self.ranges[i][1] or (self.openHigh and i == len(self.ranges) - 1):
+            return i
+        return None
+
+
+class DatasetBuilder(object):
+    """
+    Gathers the samples of each x value of a dataset, then writes it.
+
+    xLabels are the names of the x values, in order.  typecode is the
+    array.array type the samples are stored as: 'd' for floats, 'q' for
+    integers (e.g. 0/100 survey answers).
+    """
+    def __init__(self, xLabels, typecode='d', maxBufferedSamples=1000000, spillDirectory=None):
+        self.xLabels = list(xLabels)
+        self.typecode = typecode
+        self.maxBufferedSamples = maxBufferedSamples
+        self.spillDirectory = spillDirectory
+        self.buffers = [array.array(typecode) for x in self.xLabels]
+        self.bufferedSamples = 0
+        self.spillFiles = None
+        self.counts = [0] * len(self.xLabels)
+        self.sums = [0] * len(self.xLabels)
+        self.minY = None
+        self.maxY = None
+        # x values in the order they got their first sample.
+        self.firstSampled = []
+
+    # Records a sample y at the x value with index x.
+    def add(self, x, y):
+        if self.counts[x] == 0:
+            self.firstSampled.append(x)
+        self.buffers[x].append(y)
+        self.counts[x] += 1
+        self.sums[x] += self.buffers[x][-1]
+        if self.minY is None or y < self.minY:
+            self.minY = y
+        if self.maxY is None or y > self.maxY:
+            self.maxY = y
+        self.bufferedSamples += 1
+        if self.bufferedSamples >= self.maxBufferedSamples:
+            self.spill()
+
+    # Moves every buffered sample to its x value's temporary file.
+    def spill(self):
+        if self.spillFiles is None:
+            self.tempDirectory = tempfile.mkdtemp(prefix='datasetBuilder', dir=self.spillDirectory)
+            self.spillFiles = [os.path.join(self.tempDirectory, str(x) + '.bin') for x in range(len(self.xLabels))]
+        for x in range(len(self.xLabels)):
+            if len(self.buffers[x]) > 0:
+                with open(self.spillFiles[x], 'ab') as f:
+                    self.buffers[x].tofile(f)
+                self.buffers[x] = array.array(self.typecode)
+        self.bufferedSamples = 0
+
+    # Yields the samples of x value x, in the order they were added, a block at a time.
+    def samples(self, x, blockSize=65536):
+        if self.spillFiles is not None and os.path.exists(self.spillFiles[x]):
+            with open(self.spillFiles[x], 'rb') as f:
+                while True:
+                    block = array.array(self.typecode)
+                    try:
+                        block.fromfile(f, blockSize)
+                    except EOFError:
+                        pass
+                    if len(block) == 0:
+                        break
+                    yield block
+        if len(self.buffers[x]) > 0:
+            yield self.buffers[x]
+
+    def mean(self, x):
+        return self.sums[x]/self.counts[x]
+
+    # The indexes of the x values the dataset will have: those with at least minSamples samples.
+    def getXValues(self, minSamples=1):
+        return [x for x in range(len(self.xLabels)) if self.counts[x] >= max(minSamples, 1)]
+
+    def write(self, jsonFName, title, description, xlabel, ylabel, minSamples=1, writeCache=True):
+        """
+        Writes the dataset as JSON to jsonFName, in the format DataDrivenEnv
+        reads, and (with writeCache) its binary cache.  The y value of each
+        x value is the mean of its samples.  x values with fewer than
+        minSamples samples are left out of xVals and yVals, but their samples
+        are kept in All_sample.  Returns (xVals, yVals).
+        """
+        xValues = self.getXValues(minSamples)
+        xVals = [self.xLabels[x] for x in xValues]
+        yVals = [self.mean(x) for x in xValues]
+
+        # Same output as json.dump of the whole dictionary, one block of samples at a time.
+        with open(jsonFName, 'w') as f:
+            f.write('{"title": ' + json.dumps(title) + ', "description": ' + json.dumps(description) +
+                    ', "xVals": ' + json.dumps(xVals) + ', "yVals": ' + json.dumps(yVals) +
+                    ', "xlabel": ' + json.dumps(xlabel) + ', "ylabel": ' + json.dumps(ylabel) +
+                    ', "All_sample": {')
+            for i in range(len(self.firstSampled)):
+                x = self.firstSampled[i]
+                f.write((', ' if i > 0 else '') + json.dumps(self.xLabels[x]) + ': [')
+                first = True
+                for block in self.samples(x):
+                    f.write((', ' if not first else '') + json.dumps(block.tolist())[1:-1])
+                    first = False
+                f.write(']')
+            f.write('}}\n')
+
+        if writeCache:
+            self.writeCache(jsonFName, title, description, xlabel, ylabel, xVals, yVals, xValues)
+        return (xVals, yVals)
+
+    def writeCache(self, jsonFName, title, description, xlabel, ylabel, xVals, yVals, xValues):
+        sampleCounts = numpy.array([self.counts[x] for x in xValues], dtype=numpy.int64)
+        # Gathered in a file-backed array, so it need not fit in memory either.
+        directory = tempfile.mkdtemp(prefix='datasetBuilder', dir=self.spillDirectory)
+        try:
+            sampleValues = numpy.lib.format.open_memmap(os.path.join(directory, 'sampleValues.npy'), mode='w+',
+                                                        dtype=numpy.float64, shape=(int(sampleCounts.sum()),))
+            position = 0
+            for x in xValues:
+                for block in self.samples(x):
+                    sampleValues[position:position+len(block)] = block
+                    position += len(block)
+            envs.writeDatasetCache(jsonFName, {'title': title, 'description': description,
+                                               'xVals': xVals, 'yVals': yVals,
+                                               'xlabel': xlabel, 'ylabel': ylabel,
+                                               'miny': self.minY, 'maxy': self.maxY},
+                                   sampleCounts, sampleValues)
+            del sampleValues
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    # Deletes the spilled samples.
+    def close(self):
+        if self.spillFiles is not None:
+            shutil.rmtree(self.tempDirectory, ignore_errors=True)
+            self.spillFiles = None
+
+
+# Saves a bar chart of yVals against xVals to pngName, without displaying it.
+def saveBarPlot(pngName, xVals, yVals, xlabel, ylabel, title, rotation=0, ylim=None):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    plt.bar(xVals, yVals)
+    plt.xticks(rotation=rotation)
+    plt.grid(alpha=0.3)
+    plt.ticklabel_format(style='plain', axis='y')
+    if ylim is not None:
+        plt.ylim(*ylim)
+    plt.xlabel(xlabel)
+    plt.ylabel(ylabel)
+    plt.title(title)
+    plt.tight_layout()
+    plt.savefig(pngName)
+    plt.clf()
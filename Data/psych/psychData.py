@@ -1,7 +1,8 @@
-import matplotlib.pyplot as plt
-import numpy as np
-import csv
-import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import datasetBuilder as builder
 
 '''
 1 "50 mm"
@@ -27,24 +28,16 @@ for i in range(12):
     sizeDict[ii]=sizeList[i]
 
 
-f1 = open('pdpr99ve20_pd1.csv', 'r')
 firstDict={} # size in unit of mm
 totalDict={}
-secondDict={} # size without units 1-5
-totalDict2={}
-thirdDict={}
-totalDict3={}
 sizeList=[]
 num=-2
-num2=-3
 lastTrial = -1
-reader = csv.DictReader(f1)
 
-for row in reader:
-    time = int(row['ZEIT']) # miliseconds
-    size = int(row['REIZ'])
-    anotherSize = int(row['URTEIL'])
-    currentTrial = int(row['TRIAL'])
+for row in builder.readColumns('pdpr99ve20_pd1.csv', ['ZEIT', 'REIZ', 'TRIAL']):
+    time = int(row[0]) # miliseconds
+    size = int(row[1])
+    currentTrial = int(row[2])
     convertedSize = sizeDict[size]
     if time == 0:
         continue
@@ -58,7 +51,6 @@ for row in reader:
         continue
     currentSize = convertedSize
     previousSize = sizeList[num]
-    #previous2Size= sizeList[num2]
     
     newXvalue = (currentSize - previousSize)
     
@@ -66,30 +58,13 @@ for row in reader:
         continue
     totalDict[newXvalue]=totalDict.get(newXvalue,0)+1
     firstDict[newXvalue]=firstDict.get(newXvalue, 0)+time
-    
-f1.close()
 
 
-dictAllData={}
-xValues=[]
-yValues=[]
-for size in sorted(totalDict):
-    averageJudge = firstDict[size] / totalDict[size]
-    size = str(size)
-    xValues.append(size)
-    yValues.append(averageJudge)
-    if size not in dictAllData:
-        dictAllData[size] = []
-    dictAllData[size].append(averageJudge)
-plt.bar(xValues, yValues)
-plt.ylim(900,1200)
-plt.grid(alpha = 0.3)
-plt.ylabel('average time (miliseconds)')
-plt.xlabel('size (mm)')
-plt.title('Psych experiment')
-plt.savefig('psychFigure.png')
-plt.show()
-plt.clf()
+# One sample per size difference: its average reaction time.
+sizes = sorted(totalDict)
+dataset = builder.DatasetBuilder([str(size) for size in sizes])
+for i in range(len(sizes)):
+    dataset.add(i, firstDict[sizes[i]] / totalDict[sizes[i]])
 
 description = 'this is the data from an experiment ' \
               'in which peole are asked to judge ' \
@@ -98,19 +73,9 @@ description = 'this is the data from an experiment ' \
               'the average reaction time on the y axis ' \
               'and the size in mm5'
 
-dictionary =    {
-                    'title':'Psychology Experiment',
-                    'description': description,
-                    'xVals': xValues,
-                    'yVals': yValues,
-                    'xlabel': 'Size Difference Between Squares (mm)',
-                    'ylabel': 'Average Reaction Time (ms)',
-                    'All_sample': dictAllData
-                }
-
-f = open('psychData.json', 'w')
-
-json.dump(dictionary, f)
-
-f.close()
+(xValues, yValues) = dataset.write('psychData.json', 'Psychology Experiment', description,
+                                   'Size Difference Between Squares (mm)', 'Average Reaction Time (ms)')
+dataset.close()
 
+builder.saveBarPlot('psychFigure.png', xValues, yValues, 'size (mm)', 'average time (miliseconds)',
+                    'Psych experiment', ylim=(900,1200))
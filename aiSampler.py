@@ -1,11 +1,15 @@
 import cheater
 import distributions as dists
 import environments as envs
+import heapq
 import math
+import numpy
 import random
 import sys
+import trueFunctionCache
 import utilities as util
 import visualizers as vis
+from sampleStore import LeastSampledTracker
 
 # Interface (abstract) for aiSampler objects.
 class AISampler(object):
@@ -18,6 +22,12 @@ class AISampler(object):
     def chooseXValue(self):
         pass
 
+    # Returns a list of k x values to sample at once, e.g. to fill k instrument slots.
+    # pending lists the x values chosen earlier whose samples have not been processed yet.
+    # By default, calls chooseXValue k times, which ignores the other choices.
+    def chooseXValues(self, k, pending=()):
+        return [self.chooseXValue() for i in range(k)]
+
     # Processes a sample from environment.
     # Takes in a single xValue(int), and a single yValue(double)
     def processSample(self, xValue, yValue):
@@ -40,6 +50,46 @@ class AISampler(object):
     def generateVisualization(self):
         pass
 
+    # Batched interface: advances many independent runs of this sampler at once.
+    # Only samplers that return True here implement the methods below.
+    def supportsBatch(self):
+        return False
+
+    # Re-initilializes numRuns independent runs with a given MIEnvironment
+    # Returns True if initialization was successful, False otherwise
+    def initBatch(self, env, numRuns):
+        return False
+
+    # Returns a numpy array holding the chosen x value (int) of each run.
+    def chooseXBatch(self):
+        pass
+
+    # Takes in numpy arrays holding one xValue(int) and one yValue(double) per run.
+    def processSampleBatch(self, xValues, yValues):
+        pass
+
+    # Takes in a list holding the current keypoints of each run.
+    def processKeyPointsBatch(self, keypointLists):
+        pass
+
+    # Returns a tuple of arrays (lofunc, func, hifunc), each of shape (numRuns, |X|).
+    def generateVisualizationBatch(self):
+        pass
+
+
+# Returns an array holding the number of times each x value is in pending.
+def pendingCounts(pending, numXValues):
+    return numpy.bincount(numpy.asarray(pending, dtype=numpy.int64), minlength=numXValues)
+
+# Turns a list holding one keypoint list per run into a boolean array
+# of shape (numRuns, numXValues) marking the keypoint x values of each run.
+def keypointMask(keypointLists, numXValues):
+    mask = numpy.zeros((len(keypointLists), numXValues), dtype=bool)
+    for run in range(len(keypointLists)):
+        for (x, y) in keypointLists[run]:
+            mask[run, x] = True
+    return mask
+
 # A sampler that samples epsilon-greedy with respect to the existing keypoints
 # (ignores samples received so far,
 # other than to generate a visualization)
@@ -83,6 +133,36 @@ class EpsilonGreedyKeyPointSampler(AISampler):
     def processPriorTheory(self, theoryFunc):
         pass
 
+    def supportsBatch(self):
+        return True
+
+    def initBatch(self, env, numRuns):
+        self.env = env
+        self.functionVisualizer.initBatch(env, numRuns)
+        self.batchKeyPoints = numpy.zeros((numRuns, len(self.env.getXRange())), dtype=bool)
+        self.batchKeyPointCumsum = numpy.cumsum(self.batchKeyPoints, axis=1)
+        return True
+
+    def chooseXBatch(self):
+        (numRuns, numX) = self.batchKeyPoints.shape
+        numKeyPoints = self.batchKeyPointCumsum[:, -1]
+        randomX = numpy.random.randint(numX, size=numRuns)
+        # Pick the n-th keypoint of each run, n uniform over its keypoints.
+        n = (numpy.random.random(numRuns) * numKeyPoints).astype(numpy.int64)
+        keyPointX = numpy.argmax(self.batchKeyPointCumsum > n[:, None], axis=1)
+        explore = (numpy.random.random(numRuns) < self.Epsilon) | (numKeyPoints == 0)
+        return numpy.where(explore, randomX, keyPointX)
+
+    def processSampleBatch(self, xValues, yValues):
+        return self.functionVisualizer.processSampleBatch(xValues, yValues)
+
+    def processKeyPointsBatch(self, keypointLists):
+        self.batchKeyPoints = keypointMask(keypointLists, len(self.env.getXRange()))
+        self.batchKeyPointCumsum = numpy.cumsum(self.batchKeyPoints, axis=1)
+
+    def generateVisualizationBatch(self):
+        return self.functionVisualizer.generateVisualizationBatch()
+
 # A sampler that blindly round-robins among x values
 class RoundRobinSampler(AISampler):
 
@@ -100,6 +180,28 @@ class RoundRobinSampler(AISampler):
         self.index = (self.index + 1) % len(self.env.getXRange())
         return ret
 
+    def supportsBatch(self):
+        return True
+
+    def initBatch(self, env, numRuns):
+        self.env = env
+        self.functionVisualizer.initBatch(env, numRuns)
+        self.index = 0
+        self.numRuns = numRuns
+        return True
+
+    def chooseXBatch(self):
+        return numpy.full(self.numRuns, self.chooseXValue())
+
+    def processSampleBatch(self, xValues, yValues):
+        return self.functionVisualizer.processSampleBatch(xValues, yValues)
+
+    def processKeyPointsBatch(self, keypointLists):
+        pass
+
+    def generateVisualizationBatch(self):
+        return self.functionVisualizer.generateVisualizationBatch()
+
     def processSample(self, xValue, yValue):
         return self.functionVisualizer.processSample(xValue, yValue)
 
@@ -129,13 +231,13 @@ class SimpleNNTSSampler(AISampler):
     def initWithEnvironment(self,env):
         self.env = env
         self.functionVisualizer.initWithEnvironment(env)
-        self.ks = [0] * len(self.env.getXRange())
-        self.mus = [0] * len(self.env.getXRange())
-        self.samples = {}
-        for x in self.env.getXRange():
-            self.samples[x] = []
+        self.ks = numpy.zeros(len(self.env.getXRange()), dtype=numpy.int64)
+        self.mus = numpy.zeros(len(self.env.getXRange()))
+        # Shared with the visualizer, which records every sample anyway.
+        self.samples = self.functionVisualizer.samples
         self.keypoints = []
         self.rawKeyPoints = []
+        self.scoreState = util.EvalScoreState(len(self.env.getXRange()), 0.1)
         oldCI = util.getCI([], 0.1)
         newCI = util.getCI([1], 0.1)
         k = len(self.env.getXRange())
@@ -146,10 +248,8 @@ class SimpleNNTSSampler(AISampler):
         # Existing keypoints: clear (additional score from extra sample)
         # new keypoints: doesn't consider for simplicity
         # max - min
-        oldScore = util.getEvalScore(self.samples, self.rawKeyPoints, 0.1)
-        self.samples[xValue].append(newSample)
-        newScore = util.getEvalScore(self.samples, self.rawKeyPoints, 0.1)
-        self.samples[xValue].pop()
+        oldScore = self.scoreState.score()
+        newScore = self.scoreState.scoreIfAdded(xValue)
         reward = newScore - oldScore
 
         maxReward = self.maxReward
@@ -166,30 +266,42 @@ class SimpleNNTSSampler(AISampler):
         return normR
 
     def chooseXValue(self):
-        maxY = None
-        maxX = None
-        for x in self.env.getXRange():
-            sigma = math.sqrt(1/(self.ks[x] +1))
-            nDist = dists.NormalDistribution(self.mus[x], sigma)
-            y = nDist.sample()
-            if maxY is None or y > maxY:
-                maxY = y
-                maxX = x
-        return maxX
+        # One posterior draw per x; ties go to the smallest x.
+        sigmas = numpy.sqrt(1/(self.ks +1))
+        nDist = dists.NormalDistribution(self.mus, sigmas)
+        ys = nDist.sampleVector()
+        return int(numpy.argmax(ys))
+
+    def chooseXValues(self, k, pending=()):
+        """
+        Batch Thompson sampling: one posterior draw per choice.  Pending and
+        already chosen x values count as samples at their current mean, which
+        narrows their posterior so later draws spread over other x values.
+        With k=1 and nothing pending, same as chooseXValue.
+        """
+        ks = self.ks + pendingCounts(pending, len(self.ks))
+        chosen = []
+        for i in range(k):
+            sigmas = numpy.sqrt(1/(ks +1))
+            ys = dists.NormalDistribution(self.mus, sigmas).sampleVector()
+            x = int(numpy.argmax(ys))
+            ks[x] += 1
+            chosen.append(x)
+        return chosen
 
     #called before processkeypoints
     def processSample(self, xValue, yValue):
         oldtotal = self.mus[xValue] * self.ks[xValue]
         self.ks[xValue] += 1
-        r = self.getReward(xValue, self.samples[xValue], yValue)
+        r = self.getReward(xValue, self.samples, yValue)
         self.mus[xValue] = (oldtotal+r)/(self.ks[xValue])
-        self.samples[xValue].append(yValue)
+        self.scoreState.addSample(xValue)
         return self.functionVisualizer.processSample(xValue, yValue)
 
     # determines the reward in terms of keypoint
     def processKeyPoints(self,currentKeypoints):
         self.rawKeyPoints = currentKeypoints
-        pass
+        self.scoreState.setKeypoints(currentKeypoints)
 
     # Returns a tuple of functions(function, hifunc, lowfunc)
     # All functions should be dictionaries (x maps to y)
@@ -213,30 +325,44 @@ class UWPSSampler(AISampler):
     def initWithEnvironment(self,env):
         self.env = env
         self.functionVisualizer.initWithEnvironment(env)
-        self.ks = [0] * len(self.env.getXRange())
-        self.mus = [0] * len(self.env.getXRange())
-        self.samples = {}
-        for x in self.env.getXRange():
-            self.samples[x] = []
+        self.ks = numpy.zeros(len(self.env.getXRange()), dtype=numpy.int64)
+        self.mus = numpy.zeros(len(self.env.getXRange()))
+        # Shared with the visualizer, which records every sample anyway.
+        self.samples = self.functionVisualizer.samples
         self.keypoints = []
         self.rawKeyPoints = []
         return True
 
     def chooseXValue(self):
-        maxScore = None
-        maxX = None
-        for x in self.env.getXRange():
-            sigma = math.sqrt(1/(self.ks[x] +1))
-            nDist = dists.NormalDistribution(self.mus[x], sigma)
-            y = nDist.sample()
-            priorY = (self.priorTheory[x] - self.env.getMinSample()) / (self.env.getMaxSample() - self.env.getMinSample())
-            diff = abs(y - priorY)
-            uncertainty = 1/(self.ks[x] +1)
-            score = diff * uncertainty
-            if maxScore is None or score > maxScore:
-                maxScore = score
-                maxX = x
-        return maxX
+        return self.chooseXValues(1)[0]
+
+    def chooseXValues(self, k, pending=()):
+        """
+        Pending and already chosen x values count as samples at their current
+        mean: their posterior narrows and their uncertainty weight drops, so
+        the batch spreads over other x values.
+        With k=1 and nothing pending, same as chooseXValue.
+        """
+        if self.priorYs is None:
+            if hasattr(self.priorTheory, 'array'):
+                self.priorYs = self.priorTheory.array
+            else:
+                self.priorYs = numpy.array([self.priorTheory[x] for x in self.env.getXRange()])
+            self.priorYs = (self.priorYs - self.env.getMinSample()) / (self.env.getMaxSample() - self.env.getMinSample())
+        ks = self.ks + pendingCounts(pending, len(self.ks))
+        chosen = []
+        for i in range(k):
+            # One posterior draw per x; ties go to the smallest x.
+            sigmas = numpy.sqrt(1/(ks +1))
+            nDist = dists.NormalDistribution(self.mus, sigmas)
+            ys = nDist.sampleVector()
+            diffs = numpy.abs(ys - self.priorYs)
+            uncertainties = 1/(ks +1)
+            scores = diffs * uncertainties
+            x = int(numpy.argmax(scores))
+            ks[x] += 1
+            chosen.append(x)
+        return chosen
 
     #called before processkeypoints
     def processSample(self, xValue, yValue):
@@ -247,7 +373,6 @@ class UWPSSampler(AISampler):
             print("Y out of range! ", yValue)
             sys.exit(1)
         self.mus[xValue] = (oldtotal+transYVal)/self.ks[xValue]
-        self.samples[xValue].append(transYVal)
         return self.functionVisualizer.processSample(xValue, yValue)
 
     def processKeyPoints(self,currentKeypoints):
@@ -265,6 +390,8 @@ class UWPSSampler(AISampler):
 
     def processPriorTheory(self,theoryFunc):
         self.priorTheory = theoryFunc
+        # Prior theory scaled to 0-1, built by chooseXValue
+        self.priorYs = None
 
 
 class OptimalSampler(AISampler, cheater.Cheater):
@@ -279,10 +406,8 @@ class OptimalSampler(AISampler, cheater.Cheater):
         self.keypointTracker = None
         self.keypoints = None
         self.truFunc = None # see passTrueEnvironment
-        # Track samples per x coordinate.
-        self.samples = {}
-        for x in self.env.getXRange():
-            self.samples[x] = []
+        # Track samples per x coordinate (shared with the visualizer).
+        self.samples = self.functionVisualizer.samples
 
         return True
 
@@ -291,7 +416,24 @@ class OptimalSampler(AISampler, cheater.Cheater):
         This function returns the x value
         of the least sampled keypoint.
         """
-        return util.chooseOptimalXValue(self.keypoints, self.samples)
+        if self.keypointTracker is None:
+            self.keypointTracker = LeastSampledTracker([x for (x, y) in self.keypoints], self.samples.counts)
+        return self.keypointTracker.min()
+
+    def chooseXValues(self, k, pending=()):
+        """
+        The k keypoints that would be chosen one after the other if each
+        choice (and each pending x value) had already been sampled: the
+        least sampled keypoints, with ties going to the smallest x.
+        """
+        counts = self.samples.getCountArray() + pendingCounts(pending, len(self.env.getXRange()))
+        keypointXs = numpy.array(sorted(set([x for (x, y) in self.keypoints])), dtype=numpy.int64)
+        chosen = []
+        for i in range(k):
+            x = int(keypointXs[numpy.argmin(counts[keypointXs])])
+            counts[x] += 1
+            chosen.append(x)
+        return chosen
 
     def passTrueHuman(self, human):
         """
@@ -306,7 +448,8 @@ class OptimalSampler(AISampler, cheater.Cheater):
             None
         """
         # pass (hi/lo)/truFunc to human. hi/lo should be the same, by now.
-        self.keypoints = human.getUpdatedKeypoints(self.truFunc, self.truFunc)
+        self.keypoints = trueFunctionCache.getTrueKeypoints(self.trueEnv, human)
+        self.keypointTracker = None # rebuilt for these keypoints by chooseXValue
 
     def passTrueEnvironment(self, trueEnvironment):
         # Change env from MIEnvironmentInfo object to MIEnvironment object
@@ -315,10 +458,12 @@ class OptimalSampler(AISampler, cheater.Cheater):
         # get the trufunc from the environment
         # hi/lo are same function -> truFunc
         # truFunc is a dict: {x: y, x: y, x: y, ...}. The x's are ints.
-        self.truFunc = trueEnvironment.generateTrueFunction()
+        self.trueEnv = trueEnvironment
+        self.truFunc = trueFunctionCache.getTrueFunction(trueEnvironment)
 
     def processSample(self, xValue, yValue):
-        self.samples[xValue].append(yValue)
+        if self.keypointTracker is not None and xValue in self.keypointTracker:
+            self.keypointTracker.increment(xValue)
         return self.functionVisualizer.processSample(xValue, yValue)
 
     # Process prior theory
@@ -338,6 +483,37 @@ class OptimalSampler(AISampler, cheater.Cheater):
     def generateVisualization(self):
         return self.functionVisualizer.generateVisualization()
 
+    def supportsBatch(self):
+        return True
+
+    # passTrueEnvironment and passTrueHuman are called after this, as for initWithEnvironment.
+    def initBatch(self, env, numRuns):
+        self.env = env
+        self.functionVisualizer.initBatch(env, numRuns)
+        self.keypoints = None
+        self.truFunc = None
+        self.batchKeypointXes = None # see chooseXBatch
+        return True
+
+    def chooseXBatch(self):
+        """
+        Same as chooseXValue, for every run: the least sampled keypoint,
+        ties going to the smallest x as in util.chooseOptimalXValue.
+        """
+        if self.batchKeypointXes is None:
+            self.batchKeypointXes = numpy.array([x for (x, y) in self.keypoints])
+        counts = self.functionVisualizer.batchCounts[:, self.batchKeypointXes]
+        return self.batchKeypointXes[numpy.argmin(counts, axis=1)]
+
+    def processSampleBatch(self, xValues, yValues):
+        return self.functionVisualizer.processSampleBatch(xValues, yValues)
+
+    def processKeyPointsBatch(self, keypointLists):
+        pass
+
+    def generateVisualizationBatch(self):
+        return self.functionVisualizer.generateVisualizationBatch()
+
 
 class TESA(AISampler):
     """
@@ -367,6 +543,7 @@ class TESA(AISampler):
         self.env = env
         self.functionVisualizer.initWithEnvironment(env)
         self.keypoints = []
+        self.keypointSet = set()
 
         self.k = 1  #shape, sometimes called a
 
@@ -381,18 +558,29 @@ class TESA(AISampler):
         # dict mapping from x value of keypoint --> # of samples when
         # it was made a keypoint
         self.kpStartSamples = {}
-
-        # A growing dictionary of all samples at each x value.
-        self.samples = {}
-        # OriGinal samples
-        self.ogSamples = {}
+        # Largest of xM and the kpStartSamples of the current keypoints.
+        self.maxKpStart = self.xM
+
+        # All samples at each x value (shared with the visualizer).
+        self.samples = self.functionVisualizer.samples
+        # OriGinal samples: the samples at each x value when processKeyPoints
+        # was last called.  Only valid where ogEpochs[x] == epoch (the number of
+        # processKeyPoints calls so far); elsewhere x has not been sampled since,
+        # so it is the current count.  This avoids a pass over every x per call.
+        self.ogSamples = [0] * len(self.env.getXRange())
+        self.ogEpochs = [0] * len(self.env.getXRange())
+        self.epoch = 0
+
+        # Min-heaps of (samples, x) over all x values and over the keypoints.
+        # Entries are never updated in place: processSample pushes a new one,
+        # and outdated entries are dropped when they reach the top (see _heapMin).
+        self.countHeap = [(0, x) for x in self.env.getXRange()]
+        self.keypointHeap = []
 
         # Populate initialization variables in accordance
         # with the environmentally dependent quantity of x coordinates.
         for x in self.env.getXRange():
-            self.samples[x] = []
             self.kpStartSamples[x] = None
-            self.ogSamples[x] = 0
 
         return True
 
@@ -403,11 +591,7 @@ class TESA(AISampler):
         be identified as a keypoint in the future.
         """
         # Determine posterior hyperparameters for Pareto Distribution
-        maxXm = self.xM  # max start time for a keypoint (posterior value)
-        for x in self.keypoints:
-            xN = self.kpStartSamples[x]
-            if xN > maxXm:
-                maxXm = xN
+        maxXm = self.maxKpStart  # max start time for a keypoint (posterior value)
 
         shape = self.k + len(self.keypoints)
         scale = maxXm
@@ -417,23 +601,10 @@ class TESA(AISampler):
         threshold = paretoDist.sample()
         # Feed Pareto distro sample to below getProb
 
-        minKp = None
-        i_k = None
-        minSamp = None
-        i_h = None
-        for i in self.env.getXRange():
-            # we want number of samples now, regardless of keypoint id-ness
-            sampleQuantity = len(self.samples[i])
-            # Determine whether we are iterating over keypoints or
-            # x values that are not keypoints.
-            if i in self.keypoints:
-                if minKp is None or sampleQuantity < minKp:
-                    minKp = sampleQuantity
-                    i_k = i
-
-            if minSamp is None or sampleQuantity < minSamp:
-                minSamp = sampleQuantity
-                i_h = i
+        # Least sampled keypoint and least sampled x value; (samples, x)
+        # ordering breaks ties towards the smallest x.
+        (minKp, i_k) = self._heapMin(self.keypointHeap, self.keypointSet)
+        (minSamp, i_h) = self._heapMin(self.countHeap, None)
 
         if len(self.keypoints) >0 and i_k is None:
             print("error!  i_k is None!")
@@ -455,11 +626,67 @@ class TESA(AISampler):
 
         return chosenX
 
+    def chooseXValues(self, k, pending=()):
+        """
+        Makes k choices as chooseXValue would, each with its own threshold
+        and coin flip, counting every pending and already chosen x value
+        as one more sample there.  The batch thus goes to the k least
+        sampled keypoints / x values rather than k times to the same one.
+        With k=1 and nothing pending, same as chooseXValue.
+        """
+        counts = self.samples.getCountArray() + pendingCounts(pending, len(self.env.getXRange()))
+        keypointXs = numpy.array(sorted(self.keypointSet), dtype=numpy.int64)
+        chosen = []
+        for i in range(k):
+            paretoDist = dists.ParetoDistribution(self.k + len(self.keypoints), self.maxKpStart)
+            threshold = paretoDist.sample()
+            # argmin breaks ties towards the smallest x, like chooseXValue.
+            i_h = int(numpy.argmin(counts))
+            minSamp = counts[i_h]
+
+            r = random.random()
+            if len(self.keypoints) > 0 and (r >= self.epsilon_p or minSamp >= threshold):
+                x = int(keypointXs[numpy.argmin(counts[keypointXs])])
+            else:
+                x = i_h
+            counts[x] += 1
+            chosen.append(x)
+        return chosen
+
     # Processes a sample from environment.
     # Takes in a single xValue(int), and a single yValue(double)
     def processSample(self, xValue, yValue):
-        self.samples[xValue].append(yValue)
-        return self.functionVisualizer.processSample(xValue, yValue)
+        sampleQuantity = self.samples.count(xValue)
+        if self.ogEpochs[xValue] != self.epoch:
+            self.ogEpochs[xValue] = self.epoch
+            self.ogSamples[xValue] = sampleQuantity
+        ret = self.functionVisualizer.processSample(xValue, yValue)
+
+        sampleQuantity += 1
+        heapq.heappush(self.countHeap, (sampleQuantity, xValue))
+        if len(self.countHeap) > 4 * len(self.env.getXRange()) + 64:
+            self.countHeap = [(self.samples.count(x), x) for x in self.env.getXRange()]
+            heapq.heapify(self.countHeap)
+        if xValue in self.keypointSet:
+            self._pushKeypoint(xValue)
+        return ret
+
+    def _pushKeypoint(self, x):
+        heapq.heappush(self.keypointHeap, (self.samples.count(x), x))
+        if len(self.keypointHeap) > 4 * len(self.keypointSet) + 64:
+            self.keypointHeap = [(self.samples.count(kx), kx) for kx in self.keypointSet]
+            heapq.heapify(self.keypointHeap)
+
+    # Returns the (samples, x) at the top of heap, after dropping the entries
+    # which are outdated or (if members is not None) whose x is not in members.
+    # Returns (None, None) if no entry is left.
+    def _heapMin(self, heap, members):
+        while heap:
+            (sampleQuantity, x) = heap[0]
+            if sampleQuantity == self.samples.count(x) and (members is None or x in members):
+                return (sampleQuantity, x)
+            heapq.heappop(heap)
+        return (None, None)
 
     # Process prior theory
     def processPriorTheory(self, theoryFunc):
@@ -477,36 +704,30 @@ class TESA(AISampler):
                                 x is <class 'int'> and y is <class 'float'>.
         Returns: None
         """
-        removedKeypoints = []
-        newKeypoints = []
-        newestKeypoints = False
         currentXPoints = [x for (x,y) in currentKeypoints]
-
-        # Determine whether this is our first collection of keypoints.
-        if len(self.keypoints) == 0:
-            # All of these keypoints are original.
-            newKeypoints = currentXPoints
-            newestKeypoints = True
-        else:
-            for x in currentXPoints:
-                if x not in self.keypoints:
-                    newKeypoints.append(x)
-            for x in self.keypoints:
-                if x not in currentXPoints:
-                    removedKeypoints.append(x)
+        currentXSet = set(currentXPoints)
+        # On our first collection of keypoints, all of them are original.
+        newKeypoints = currentXSet - self.keypointSet
+        removedKeypoints = self.keypointSet - currentXSet
 
         # Update tracker for quantity of samples per x value.
         # Do not update keypoints a second time (unless removed).
-        for x in self.env.getXRange():
-            if x in newKeypoints:
-                self.kpStartSamples[x] = (len(self.samples[x]) + self.ogSamples[x] ) / 2
-
-            if x in removedKeypoints:
-                # Reset sample tracker - not required, but safer.
-                self.kpStartSamples[x] = None
+        for x in newKeypoints:
+            ogSamples = self.ogSamples[x] if self.ogEpochs[x] == self.epoch else self.samples.count(x)
+            self.kpStartSamples[x] = (self.samples.count(x) + ogSamples) / 2
+        for x in removedKeypoints:
+            # Reset sample tracker - not required, but safer.
+            self.kpStartSamples[x] = None
+        self.epoch += 1
 
-            self.ogSamples[x] = len(self.samples[x])
         self.keypoints = currentXPoints
+        self.keypointSet = currentXSet
+        for x in newKeypoints:
+            self._pushKeypoint(x)
+        self.maxKpStart = self.xM
+        for x in self.keypoints:
+            if self.kpStartSamples[x] > self.maxKpStart:
+                self.maxKpStart = self.kpStartSamples[x]
 
     # Returns a tuple of functions(lofunc, function, hifunc)
     # All functions should be dictionaries (x maps to y)
@@ -516,24 +737,63 @@ class TESA(AISampler):
     def generateVisualization(self):
         return self.functionVisualizer.generateVisualization()
 
+    def supportsBatch(self):
+        return True
 
+    def initBatch(self, env, numRuns):
+        self.env = env
+        self.functionVisualizer.initBatch(env, numRuns)
+        self.k = 1
+        self.epsilon_p = 0.1
+        numX = len(self.env.getXRange())
+        # Same bookkeeping as initWithEnvironment, one row per run.
+        # kpStartSamples is NaN where initWithEnvironment would hold None.
+        self.batchKeypoints = numpy.zeros((numRuns, numX), dtype=bool)
+        self.batchKpStartSamples = numpy.full((numRuns, numX), numpy.nan)
+        self.batchOgSamples = numpy.zeros((numRuns, numX), dtype=numpy.int64)
+        return True
 
+    def chooseXBatch(self):
+        """
+        Same as chooseXValue, for every run at once.
+        Ties go to the smallest x, as in chooseXValue.
+        """
+        counts = self.functionVisualizer.batchCounts
+        numRuns = counts.shape[0]
+        numKeypoints = self.batchKeypoints.sum(axis=1)
 
+        # Posterior Pareto hyperparameters, then one threshold per run.
+        kpStarts = numpy.where(self.batchKeypoints, self.batchKpStartSamples, -numpy.inf)
+        scale = numpy.maximum(kpStarts.max(axis=1), self.xM)
+        shape = self.k + numKeypoints
+        threshold = dists.ParetoDistribution(shape, scale).sampleVector()
 
+        i_k = numpy.argmin(numpy.where(self.batchKeypoints, counts, numpy.iinfo(numpy.int64).max), axis=1)
+        i_h = numpy.argmin(counts, axis=1)
+        minSamp = counts[numpy.arange(numRuns), i_h]
 
+        r = numpy.random.random(numRuns)
+        chooseKeypoint = (numKeypoints > 0) & ((r >= self.epsilon_p) | (minSamp >= threshold))
+        return numpy.where(chooseKeypoint, i_k, i_h)
 
+    def processSampleBatch(self, xValues, yValues):
+        return self.functionVisualizer.processSampleBatch(xValues, yValues)
 
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+    def processKeyPointsBatch(self, keypointLists):
+        """
+        Same as processKeyPoints, for every run at once.
+        keypointLists holds the current keypoints of each run.
+        """
+        counts = self.functionVisualizer.batchCounts
+        currentKeypoints = keypointMask(keypointLists, counts.shape[1])
+        newKeypoints = currentKeypoints & ~self.batchKeypoints
+        removedKeypoints = self.batchKeypoints & ~currentKeypoints
+
+        self.batchKpStartSamples[newKeypoints] = ((counts + self.batchOgSamples) / 2)[newKeypoints]
+        # Reset sample tracker - not required, but safer.
+        self.batchKpStartSamples[removedKeypoints] = numpy.nan
+        self.batchOgSamples = counts.copy()
+        self.batchKeypoints = currentKeypoints
+
+    def generateVisualizationBatch(self):
+        return self.functionVisualizer.generateVisualizationBatch()
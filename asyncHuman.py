@@ -0,0 +1,212 @@
+# Asynchronous keypoints, so sampling never waits for the scientist.
+#
+# graphs.py asks the simulated human for keypoints every ASK_PERIOD samples
+# and gets them back instantly.  A real scientist takes minutes to answer,
+# and the instrument should not sit idle meanwhile.  Here the visualizations
+# are published to a keypoint service instead: the AI keeps choosing x values
+# with the last keypoints it was given, and new keypoints are passed to
+# processKeyPoints as soon as they arrive.
+#
+# LocalKeypointService stands in for the scientist: it answers with one of the
+# simulated humans of humanSampler.py after a configurable response latency.
+#
+# Usage (from the repository root), e.g. a 0.5 s human and a 10 ms instrument:
+#   python asyncHuman.py --envs Psychology --humans SimilarPointsHuman --ais TESA-10 \
+#       --iterations 3 --horizon 1000 --latency 0.5 --sample-time 0.01
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import numpy
+import experimentConfig as config
+import graphs
+import resultsStore
+import statsTrack as stat
+
+
+# Returns a copy of func (a dictionary, numpy array or visualizers.FunctionView)
+# that later samples will not change.
+def snapshot(func):
+    if isinstance(func, numpy.ndarray):
+        return func.copy()
+    if hasattr(func, 'array'):
+        return numpy.array(func.array)
+    return dict(func)
+
+
+# Interface for the services that place keypoints on a visualization.
+class KeypointService(object):
+
+    # Returns the keypoints [(x,y),(x,y),...] for lofunc and hifunc,
+    # like humanSampler.getUpdatedKeypoints.
+    async def getKeypoints(self, lofunc, hifunc):
+        pass
+
+
+class LocalKeypointService(KeypointService):
+    """
+    Answers with the keypoints of a simulated human, after latency seconds
+    plus up to jitter more.  The delays are drawn from their own generator,
+    so they do not change the random numbers the simulation draws.
+    """
+    def __init__(self, human, latency=0.0, jitter=0.0, seed=None):
+        self.human = human
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+
+    async def getKeypoints(self, lofunc, hifunc):
+        await asyncio.sleep(self.latency + self.random.uniform(0, self.jitter))
+        return self.human.getUpdatedKeypointsArray(lofunc, hifunc)
+
+
+class AsyncHumanSampler(object):
+    """
+    Sends visualizations to a KeypointService without waiting for the answer.
+
+    The service works on one visualization at a time.  Visualizations
+    published while it is busy replace each other, so once it is done it
+    is shown the most recent one.  Must be used inside a running event loop.
+    """
+    def __init__(self, service):
+        self.service = service
+        self.task = None
+        self.queued = None
+        self.keypoints = None
+        self.updates = 0
+
+    # Sends (a snapshot of) lofunc and hifunc to the service.
+    def publish(self, lofunc, hifunc):
+        functions = (snapshot(lofunc), snapshot(hifunc))
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self._request(functions))
+        else:
+            self.queued = functions
+
+    async def _request(self, functions):
+        while functions is not None:
+            self.keypoints = await self.service.getKeypoints(*functions)
+            self.updates += 1
+            (functions, self.queued) = (self.queued, None)
+        self.task = None
+
+    # Returns the keypoints that arrived since the last call, or None.
+    def getNewKeypoints(self):
+        (keypoints, self.keypoints) = (self.keypoints, None)
+        return keypoints
+
+    # Cancels the request in progress, if any.
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        self.queued = None
+
+
+async def runIteration(env, ai, evaluator, humanSampler, trueKeypointsList, tlimit, askPeriod, sampleTime):
+    """
+    Runs one iteration like graphs.runIterations (with EVAL_IMMEDIATELY),
+    but publishes the visualization to humanSampler every askPeriod samples
+    and hands the keypoints to the AI whenever they arrive.  Each sample
+    takes sampleTime seconds, during which the service can make progress.
+    Returns (the cumulative regret at each timestep, the number of keypoint
+    updates the AI got).
+    """
+    trajectory = numpy.zeros(tlimit)
+    cumulativeScore = 0.0
+    for t in range(tlimit):
+        chosenX = ai.chooseXValue()
+        (yValue, toProcess) = env.sample(chosenX)
+        for (xValue, yValue) in toProcess:
+            ai.processSample(xValue, yValue)
+            evaluator.processAISample(xValue, yValue)
+        evaluator.processKeypoints(trueKeypointsList)
+
+        if t % askPeriod == askPeriod - 1:
+            (lofunc, func, hifunc) = ai.generateVisualization()
+            humanSampler.publish(lofunc, hifunc)
+
+        # The instrument takes sampleTime; the human may answer meanwhile.
+        await asyncio.sleep(sampleTime)
+        keypointList = humanSampler.getNewKeypoints()
+        if keypointList is not None:
+            ai.processKeyPoints(keypointList)
+            evaluator.processEmpiricalKeypoints(keypointList)
+
+        cumulativeScore += evaluator.getCurrentScore()
+        trajectory[t] = cumulativeScore
+    updates = humanSampler.updates
+    await humanSampler.close()
+    return (trajectory, updates)
+
+
+# Runs every iteration of one cell of graphs' experiment; returns (StatsTrackerArray, keypoint updates per iteration), or None.
+def runCell(envIndex, aiIndex, latency, jitter, sampleTime):
+    prepared = graphs.prepareEnvironment(envIndex)
+    if prepared is None:
+        return None
+    (initSamples, trueKeypointsList, evaluator) = prepared
+    env, envName, human, humanName, tlimit = graphs.getEnvTuple(envIndex)
+    ai, aiName = graphs.getAITuple(aiIndex)
+
+    learnerResults = stat.StatsTrackerArray(tlimit)
+    updates = []
+    for it in range(graphs.NUM_ITERATIONS):
+        if not graphs.startIteration(envIndex, aiIndex, it):
+            return None
+        service = LocalKeypointService(human, latency, jitter, seed=graphs.deriveSeed(envName, humanName, aiName, it, 'latency'))
+        (trajectory, iterationUpdates) = asyncio.run(runIteration(env, ai, evaluator, AsyncHumanSampler(service),
+                                                                  trueKeypointsList, tlimit, graphs.ASK_PERIOD, sampleTime))
+        learnerResults.update(trajectory)
+        updates.append(iterationUpdates)
+    return (learnerResults, updates)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the simulations with a human that answers asynchronously, "
+                                     "after a delay, while the AI keeps sampling.")
+    parser.add_argument("--envs", nargs="+", metavar="ENV", help="environments to run, e.g. Economics Psychology")
+    parser.add_argument("--humans", nargs="+", metavar="HUMAN", help="simulated humans to run, e.g. CriticalPointsHuman")
+    parser.add_argument("--ais", nargs="+", metavar="AI", help="AIs to run, e.g. TESA-10 Optimal")
+    parser.add_argument("--iterations", type=int, default=1, help="runs averaged per cell (default: %(default)s)")
+    parser.add_argument("--horizon", type=int, default=1000, help="timesteps per run (default: %(default)s)")
+    parser.add_argument("--ask-period", type=int, help="timesteps between visualizations sent to the human")
+    parser.add_argument("--latency", type=float, default=0.1,
+                        help="seconds the human takes to answer (default: %(default)s)")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="up to this many more seconds, drawn at random (default: %(default)s)")
+    parser.add_argument("--sample-time", type=float, default=0.001,
+                        help="seconds each sample takes (default: %(default)s)")
+    parser.add_argument("--results-dir", help="also write the results to this directory (see resultsStore.py)")
+    args = parser.parse_args()
+
+    graphs.configure(config.makeExperiment(envNames=args.envs, humanNames=args.humans, aiNames=args.ais,
+                                           iterations=args.iterations, horizon=args.horizon,
+                                           askPeriod=args.ask_period))
+    allResults = {}
+    for envIndex in range(len(graphs.envSpecs)):
+        for aiIndex in range(len(graphs.aiNames)):
+            envSpec = graphs.envSpecs[envIndex]
+            (envName, humanName) = (envSpec["envName"], envSpec["human"])
+            tlimit = config.getTimeLimit(graphs.experiment, envSpec)
+            aiName = graphs.aiNames[aiIndex]
+            start = time.perf_counter()
+            cell = runCell(envIndex, aiIndex, args.latency, args.jitter, args.sample_time)
+            elapsed = time.perf_counter() - start
+            if cell is None:
+                print("Learner unimplemented, moving to next learner.")
+                continue
+            (learnerResults, updates) = cell
+            print("Human: ", humanName, "AI: ", aiName, "final regret: %.2f" % learnerResults.getMeans()[-1],
+                  "keypoint updates per run: %.1f" % numpy.mean(updates),
+                  "samples/s: %.0f" % (tlimit * graphs.NUM_ITERATIONS / elapsed))
+            allResults[json.dumps((envName, humanName, aiName))] = list(zip(learnerResults.getMeans().tolist(),
+                                                                             learnerResults.getCIs().tolist()))
+    if args.results_dir is not None:
+        resultsStore.writeResults(args.results_dir, allResults)
@@ -0,0 +1,210 @@
+# Measures the per-call cost of every piece of the simulation hot loop:
+# chooseXValue / processSample / processKeyPoints of each AI, the humans'
+# getUpdatedKeypoints(Array), RegretEvaluator.processKeypoints, utilities.getEvalScore
+# and BasicVisualizer.generateVisualization, on the bundled datasets and on
+# synthetic environments with many more x values.
+#
+# Each call is timed on a warmed-up object (samples and keypoints already
+# processed), and reported as ns per call, together with the peak memory
+# allocated during a call (measured separately, with tracemalloc).
+#
+# Usage (from the repository root):
+#   python benchmarks/benchmarkSteps.py
+#   python benchmarks/benchmarkSteps.py --sizes 1000 10000 --save bench.json
+#   python benchmarks/benchmarkSteps.py --baseline bench.json   # exits 1 on regressions
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy
+import aiSampler as ais
+import cheater
+import environments as envs
+import evaluators as evals
+import experimentConfig as config
+import humanSampler as hu
+import profiling
+import utilities as util
+import visualizers as vis
+
+
+# Samples processed before anything is timed.
+WARMUP_SAMPLES = 2000
+
+# Each benchmark is called until this many seconds have passed (or MAX_CALLS calls).
+TIME_BUDGET = 0.2
+MAX_CALLS = 100000
+
+# Calls measured with tracemalloc for the allocation figures.
+ALLOC_CALLS = 20
+
+
+# Returns the average ns per call of func.
+def timeCall(func):
+    calls = 0
+    start = time.perf_counter_ns()
+    elapsed = 0
+    while calls < MAX_CALLS and (calls == 0 or elapsed < TIME_BUDGET * 1e9):
+        func()
+        calls += 1
+        elapsed = time.perf_counter_ns() - start
+    return elapsed / calls
+
+# Returns the largest number of bytes allocated during a single call of func.
+def peakAllocation(func):
+    tracemalloc.start()
+    peak = 0
+    for i in range(ALLOC_CALLS):
+        profiling.resetPeak()
+        (current, _) = tracemalloc.get_traced_memory()
+        func()
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+    return peak
+
+
+# Same initial samples as graphs.getInitialSamples.
+def getInitialSamples(env, numSamples):
+    ret = []
+    curX = 0
+    for i in range(numSamples):
+        curX = (curX + 7) % len(env.getXRange())
+        (y, toProcess) = env.sample(curX)
+        ret.append((curX, y))
+    return ret
+
+# Humans with the parameters used by graphs.py, initialized for env.
+def makeHumans(env):
+    info = envs.MIEnvironmentInfo(env)
+    initSamples = getInitialSamples(env, 10)
+    humans = [("CriticalPointsHuman", hu.CriticalPointsHuman(0.7, 0.05)),
+              ("SimilarPointsHuman", hu.SimilarPointsHuman(0.1, 0.5, 0.7)),
+              ("DifferenceBasedHuman", hu.DifferenceBasedHuman(hu.EmpTheoryGetter, 0.05 * (env.getMaxSample() - env.getMinSample())))]
+    for (name, human) in humans:
+        human.initWithEnvironment(info)
+        human.buildTheoryFromInitialSamples(initSamples)
+    return (humans, initSamples)
+
+# Pre-drawn (x, y) samples, cycled through by processSample benchmarks.
+def drawSamples(env, numSamples):
+    xs = numpy.random.randint(len(env.getXRange()), size=numSamples)
+    return [(int(x), env.sample(int(x))[0]) for x in xs]
+
+def cycle(samples):
+    position = [0]
+    def nextSample():
+        position[0] = (position[0] + 1) % len(samples)
+        return samples[position[0]]
+    return nextSample
+
+
+def benchmarkEnvironment(envName, env, aiNames, results):
+    numpy.random.seed(0)
+    env.seed(0)
+    info = envs.MIEnvironmentInfo(env)
+    samples = drawSamples(env, WARMUP_SAMPLES)
+    (humans, initSamples) = makeHumans(env)
+    keypointHuman = humans[0][1]
+
+    def record(name, func):
+        nsPerCall = timeCall(func)
+        peak = peakAllocation(func)
+        results.append({"benchmark": name, "env": envName, "numX": len(env.getXRange()),
+                        "nsPerCall": nsPerCall, "peakBytes": peak})
+        print("%-52s %-16s %7d x %12.0f ns/call %10d peak bytes" % (name, envName, len(env.getXRange()), nsPerCall, peak))
+
+    # A warmed-up visualizer, which also provides the functions shown to the humans.
+    visualizer = vis.BasicVisualizer(0.1)
+    visualizer.initWithEnvironment(info)
+    for (x, y) in samples:
+        visualizer.processSample(x, y)
+    (lofunc, func, hifunc) = visualizer.generateVisualization()
+    keypoints = keypointHuman.getUpdatedKeypoints(lofunc, hifunc)
+    if len(keypoints) == 0:
+        keypoints = [(x, func[x]) for x in env.getXRange()[::10]]
+
+    record("BasicVisualizer.generateVisualization", visualizer.generateVisualization)
+    for (humanName, human) in humans:
+        record(humanName + ".getUpdatedKeypoints", lambda: human.getUpdatedKeypoints(lofunc, hifunc))
+        record(humanName + ".getUpdatedKeypointsArray", lambda: human.getUpdatedKeypointsArray(lofunc, hifunc))
+
+    sampleLists = [[y for (x, y) in samples if x == xv] for xv in env.getXRange()]
+    record("utilities.getEvalScore", lambda: util.getEvalScore(sampleLists, keypoints, 0.1))
+
+    evaluator = evals.RegretEvaluator()
+    evaluator.passTrueEnvironment(env)
+    evaluator.initWithEnvironment(info)
+    for (x, y) in samples:
+        evaluator.processAISample(x, y)
+    record("RegretEvaluator.processKeypoints", lambda: evaluator.processKeypoints(keypoints))
+
+    for aiName in aiNames:
+        ai = config.buildAI(aiName)
+        ai.processPriorTheory(keypointHuman.buildTheoryFromInitialSamples(initSamples))
+        ai.initWithEnvironment(info)
+        if isinstance(ai, cheater.Cheater):
+            ai.passTrueEnvironment(env)
+            ai.passTrueHuman(keypointHuman)
+        ai.processKeyPoints(keypoints)
+        for (x, y) in samples:
+            ai.processSample(x, y)
+        nextSample = cycle(samples)
+        record(aiName + ".chooseXValue", ai.chooseXValue)
+        record(aiName + ".processSample", lambda: ai.processSample(*nextSample()))
+        record(aiName + ".processKeyPoints", lambda: ai.processKeyPoints(keypoints))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the per-step cost of the simulation components.")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[1000],
+                        help="|X| of the synthetic environments (default: %(default)s)")
+    parser.add_argument("--ais", nargs="+", default=["Round_Robin", "Epsilon_Greedy", "Thompson", "UWPS", "TESA-10", "Optimal"],
+                        help="AIs to benchmark (default: one of each type)")
+    parser.add_argument("--no-datasets", action="store_true", help="skip the bundled datasets")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against results saved with --save")
+    parser.add_argument("--tolerance", type=float, default=1.5,
+                        help="with --baseline, fail if a benchmark is this many times slower (default: %(default)s)")
+    args = parser.parse_args()
+
+    environments = []
+    if not args.no_datasets:
+        datasets = []
+        for envSpec in config.DEFAULT_ENVS:
+            if envSpec["dataset"] not in datasets:
+                datasets.append(envSpec["dataset"])
+                environments.append((envSpec["envName"], envs.DataDrivenEnv(os.path.join(ROOT, envSpec["dataset"]))))
+    for numX in args.sizes:
+        environments.append(("Synthetic", envs.SineEnv(numX)))
+
+    results = []
+    for (envName, env) in environments:
+        benchmarkEnvironment(envName, env, args.ais, results)
+
+    if args.save is not None:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=1)
+
+    if args.baseline is not None:
+        with open(args.baseline, "r") as f:
+            baseline = dict(((r["benchmark"], r["env"], r["numX"]), r) for r in json.load(f))
+        regressions = 0
+        for r in results:
+            old = baseline.get((r["benchmark"], r["env"], r["numX"]))
+            if old is not None and r["nsPerCall"] > args.tolerance * old["nsPerCall"]:
+                regressions += 1
+                print("REGRESSION: %s on %s (%d x): %.0f ns/call, was %.0f" %
+                      (r["benchmark"], r["env"], r["numX"], r["nsPerCall"], old["nsPerCall"]))
+        if regressions > 0:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# Checkpoints for long simulation runs (see graphs.py --resume).
+#
+# Every finished (env, human, ai) cell is written to its own file as soon as
+# it completes, and unfinished cells can periodically save the StatsTrackerArray
+# state of the iterations merged so far.  All files are written atomically,
+# so an interrupted run never leaves a half-written checkpoint behind.
+
+import hashlib
+import json
+import os
+import re
+import statsTrack as stat
+
+
+# A hash of an environment spec (see experimentConfig.py) that is the same in every run.
+def envSpecHash(envSpec):
+    return hashlib.sha256(json.dumps(envSpec, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+# Writes obj as JSON to path, replacing any existing file in a single step.
+# Several processes may write the same path at once; the last one wins.
+def atomicWriteJson(path, obj):
+    tmpPath = path + '.' + str(os.getpid()) + '.tmp'
+    with open(tmpPath, 'w') as f:
+        json.dump(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmpPath, path)
+
+
+class CheckpointStore(object):
+    """
+    A directory of per-cell checkpoints.  A cell is an environment spec
+    (see experimentConfig.py) and an AI name.
+
+    settings describes the run (seed, iterations, horizon, ...).  Checkpoints
+    written under different settings, or for an environment spec that has
+    changed since (e.g. its humanParams), would not reproduce the same
+    results, so they are ignored when loading.
+    """
+    def __init__(self, directory, settings):
+        self.directory = directory
+        self.settings = settings
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, envSpec, aiName, suffix):
+        name = '_'.join([envSpec['envName'], envSpec['human'], aiName])
+        name = re.sub(r'[^A-Za-z0-9_.-]', '-', name)
+        return os.path.join(self.directory, name + suffix)
+
+    def _load(self, path, envSpec):
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as f:
+            checkpoint = json.load(f)
+        if checkpoint['settings'] != self.settings:
+            print("Ignoring checkpoint from a run with different settings:", path)
+            return None
+        if checkpoint.get('envSpec') != envSpecHash(envSpec):
+            print("Ignoring checkpoint from a run with a different environment spec:", path)
+            return None
+        return checkpoint
+
+    # Records the final [(mean, ci), ...] results of a cell.
+    def saveFinished(self, envSpec, aiName, results):
+        atomicWriteJson(self._path(envSpec, aiName, '.json'),
+                        {'settings': self.settings, 'envSpec': envSpecHash(envSpec), 'results': results})
+        partialPath = self._path(envSpec, aiName, '.partial.json')
+        if os.path.exists(partialPath):
+            os.remove(partialPath)
+
+    # Returns the results saved by saveFinished, or None.
+    def loadFinished(self, envSpec, aiName):
+        checkpoint = self._load(self._path(envSpec, aiName, '.json'), envSpec)
+        if checkpoint is None:
+            return None
+        return [tuple(r) for r in checkpoint['results']]
+
+    # Records the StatsTrackerArray of the first iterationsDone iterations of a cell.
+    def savePartial(self, envSpec, aiName, iterationsDone, trackers):
+        atomicWriteJson(self._path(envSpec, aiName, '.partial.json'),
+                        {'settings': self.settings,
+                         'envSpec': envSpecHash(envSpec),
+                         'iterationsDone': iterationsDone,
+                         'aggregates': trackers.getAggregates()})
+
+    # Returns (iterationsDone, trackers) saved by savePartial, or None.
+    def loadPartial(self, envSpec, aiName):
+        checkpoint = self._load(self._path(envSpec, aiName, '.partial.json'), envSpec)
+        if checkpoint is None:
+            return None
+        return (checkpoint['iterationsDone'], stat.StatsTrackerArray.fromAggregates(checkpoint['aggregates']))
@@ -5,6 +5,8 @@ from scipy.stats import norm
 # Simple class for a Normal (Gaussian) Distribution
 #
 # Parameters: mean (mu) and standard deviation (sigma)
+# The parameters may also be numpy arrays, describing one independent
+# distribution per element; sampleVector then draws from all of them at once.
 class NormalDistribution(object):
     def __init__(self, mean, stdDev):
         self.mean = mean
@@ -15,6 +17,11 @@ class NormalDistribution(object):
         samples = numpy.random.normal(self.mean, self.stdDev, 1)
         return samples[0]
 
+    #Draws one sample per element of the (array) parameters.
+    #Uses the same random stream as calling sample on each element in turn.
+    def sampleVector(self):
+        return numpy.random.normal(self.mean, self.stdDev)
+
     #gets the standard deviation
     def getStdDev(self):
        return self.stdDev
@@ -79,6 +86,7 @@ class BetaDistribution(object):
 # Models a Pareto Distribution.
 # See https://docs.scipy.org/doc/numpy-1.13.0/reference/generated/numpy.random.pareto.html#numpy.random.pareto
 # See https://en.wikipedia.org/wiki/Pareto_distribution     
+# As with NormalDistribution, shape and scale may be numpy arrays.
 class ParetoDistribution(object):
     def __init__(self, shape, scale):
         self.shape = shape
@@ -89,6 +97,11 @@ class ParetoDistribution(object):
         samples = (numpy.random.pareto(self.shape, 1) + 1) * self.scale
         return samples[0]
 
+    #Draws one sample per element of the (array) parameters.
+    def sampleVector(self):
+        shape = numpy.broadcast(self.shape, self.scale).shape
+        return (numpy.random.pareto(self.shape, shape) + 1) * self.scale
+
     #get shape parameter
     def getShape(self):
        return self.shape
@@ -1,7 +1,41 @@
-import random
+import hashlib
+import numpy
+import os
+from scipy.stats import norm
 import distributions as dist
 import sys
 import json
+# Bump when the layout of DataDrivenEnv's dataset cache changes.
+DATASET_CACHE_VERSION = 1
+
+def fileSha1(fileName):
+    digest = hashlib.sha1()
+    with open(fileName, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Writes the binary cache DataDrivenEnv loads in place of the dataset jsonFName.
+# header holds the dataset's title, description, xVals, yVals, xlabel, ylabel,
+# miny and maxy.  sampleValues holds the samples of each x value in turn, and
+# sampleCounts how many there are per x value.
+def writeDatasetCache(jsonFName, header, sampleCounts, sampleValues):
+    fileStat = os.stat(jsonFName)
+    header = dict(header)
+    header.update({'version': DATASET_CACHE_VERSION, 'sourceSize': fileStat.st_size,
+                   'sourceMtime': fileStat.st_mtime_ns, 'sourceSha1': fileSha1(jsonFName)})
+    cachePath = DataDrivenEnv.getCachePath(jsonFName)
+    tmpPath = cachePath + '.' + str(os.getpid()) + '.tmp'
+    try:
+        with open(tmpPath, 'wb') as f:
+            numpy.savez(f, header=numpy.array(json.dumps(header)),
+                        sampleCounts=sampleCounts, sampleValues=sampleValues)
+        os.replace(tmpPath, cachePath)
+    except OSError:
+        # e.g. a read-only dataset folder; the cache is only an optimization.
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+
 # Abstract class.
 # A fully-defined Mixed Initiative Sampling Environment
 class MIEnvironment(object):
@@ -11,6 +45,18 @@ class MIEnvironment(object):
     def reset(self):
         pass
 
+    # Re-seeds the environment's own random number generator, if it has one.
+    def seed(self, seed):
+        pass
+
+    # Common random numbers: re-seeds the environment so that the n-th
+    # sample() at each x is always the same for a given seed, whatever was
+    # sampled before or at other x values.  Each x gets its own stream,
+    # seeded from (seed, x).  seed() goes back to a single stream.
+    # Environments without their own generator ignore this.
+    def seedStreams(self, seed):
+        pass
+
     # Takes in a xValue(int)
     # yValues are:
     # Guranteed to be between minSample and maxSample
@@ -19,9 +65,21 @@ class MIEnvironment(object):
     def sample(self,xValue):
         pass
 
+    # Takes in a numpy array of xValues(int), e.g. one per simulated run.
+    # Returns a numpy array holding one y value sampled at each of them.
+    def sampleBatch(self, xValues):
+        return numpy.array([self.sample(x)[0] for x in xValues])
+
     # Generates true function, (true mean yValues for all xValues).
     def generateTrueFunction(self):
         pass
+
+    # Returns a value (made of tuples, strings and numbers) that identifies the
+    # true function, such that environments with the same key have the same
+    # true function.  None means the environment cannot be cached.
+    # See trueFunctionCache.
+    def getCacheKey(self):
+        return None
     
     def getXRange(self):
         pass
@@ -50,8 +108,34 @@ class MIEnvironmentInfo(object):
         return self.sample
 
 
+# An environment which samples y values from a dataset of real observations.
+#
+# The observations are kept as one flat numpy array, and all random draws come
+# from the environment's own numpy.random.Generator (see seed).
+# With bufferSize > 0, sample() draws bufferSize y values per x at a time
+# and then serves them one by one, so a single sample is a list lookup.
+#
+# With useCache, the parsed and validated dataset is saved next to the JSON
+# file (see getCachePath) and later loaded from there, as long as the JSON
+# file has not changed since.
 class DataDrivenEnv(MIEnvironment):
-    def __init__(self, jsonFName):
+    def __init__(self, jsonFName, bufferSize=1024, seed=None, useCache=True):
+        fileStat = os.stat(jsonFName)
+        if not (useCache and self.loadCache(jsonFName, fileStat)):
+            self.loadJson(jsonFName)
+            if useCache:
+                self.saveCache(jsonFName)
+
+        # The samples at x are sampleValues[sampleOffsets[x]:sampleOffsets[x]+sampleCounts[x]]
+        self.xRange = range(len(self.xVals))
+        self.sampleOffsets = numpy.concatenate(([0], numpy.cumsum(self.sampleCounts)[:-1]))
+
+        self.bufferSize = bufferSize
+        self.seed(seed)
+
+        self.cacheKey = ('DataDrivenEnv', os.path.abspath(jsonFName), fileStat.st_size, fileStat.st_mtime_ns)
+
+    def loadJson(self, jsonFName):
         f = open(jsonFName, 'r', encoding='utf-8')
         dictionary = json.load(f)
         f.close()
@@ -63,7 +147,6 @@ class DataDrivenEnv(MIEnvironment):
 
         self.title = dictionary['title']
         self.description = dictionary['description']
-        self.xRange = range(len(dictionary['xVals']))
         self.xVals = dictionary['xVals']
         self.yVals = dictionary['yVals']
         self.xlabel = dictionary['xlabel']
@@ -82,11 +165,11 @@ class DataDrivenEnv(MIEnvironment):
         self.miny = overallMin
         self.maxy = overallMax
         
-        self.allSamplesList = []
+        allSamplesList = []
         for i in range(len(self.xVals)):
             key = self.xVals[i]
             y = self.yVals[i]
-            self.allSamplesList.append(allSamples[key])
+            allSamplesList.append(allSamples[key])
             average = sum(allSamples[key])/len(allSamples[key])
             difference = average - y
             absDiff = abs(difference)
@@ -94,6 +177,76 @@ class DataDrivenEnv(MIEnvironment):
                 print('Samples in json file do not match. Cannot preceed')
                 sys.exit(1)
 
+        # The same samples as one flat array.
+        self.sampleCounts = numpy.array([len(s) for s in allSamplesList])
+        self.sampleValues = numpy.concatenate([numpy.asarray(s, dtype=float) for s in allSamplesList])
+
+    # The binary cache of the dataset in jsonFName.
+    @staticmethod
+    def getCachePath(jsonFName):
+        return os.path.splitext(jsonFName)[0] + '.cache.npz'
+
+    # Loads the dataset from its cache, if it was built from the current JSON file.
+    # Returns True if it was loaded.
+    def loadCache(self, jsonFName, fileStat):
+        cachePath = self.getCachePath(jsonFName)
+        if not os.path.exists(cachePath):
+            return False
+        try:
+            with numpy.load(cachePath) as cache:
+                header = json.loads(str(cache['header']))
+                if header['version'] != DATASET_CACHE_VERSION or header['sourceSize'] != fileStat.st_size:
+                    return False
+                # A changed mtime with the same contents (e.g. after a checkout) is fine.
+                touched = header['sourceMtime'] != fileStat.st_mtime_ns
+                if touched and header['sourceSha1'] != fileSha1(jsonFName):
+                    return False
+                self.sampleCounts = cache['sampleCounts']
+                self.sampleValues = cache['sampleValues']
+        except (OSError, ValueError, KeyError):
+            print('Ignoring unreadable dataset cache', cachePath)
+            return False
+        self.title = header['title']
+        self.description = header['description']
+        self.xVals = header['xVals']
+        self.yVals = header['yVals']
+        self.xlabel = header['xlabel']
+        self.ylabel = header['ylabel']
+        self.miny = header['miny']
+        self.maxy = header['maxy']
+        if touched:
+            self.saveCache(jsonFName)
+        return True
+
+    def saveCache(self, jsonFName):
+        writeDatasetCache(jsonFName, {'title': self.title, 'description': self.description,
+                                      'xVals': self.xVals, 'yVals': self.yVals,
+                                      'xlabel': self.xlabel, 'ylabel': self.ylabel,
+                                      'miny': self.miny, 'maxy': self.maxy},
+                          self.sampleCounts, self.sampleValues)
+
+    # Re-seeds the generator behind every draw, and drops any pre-drawn samples.
+    def seed(self, seed):
+        self.rng = numpy.random.default_rng(seed)
+        # Per-x generators, see seedStreams.
+        self.streamSeed = None
+        self.streams = {}
+        # Ring of pre-drawn y values per x, and the position of the next one to serve.
+        self.buffers = [None] * len(self.xRange)
+        self.bufferPositions = [self.bufferSize] * len(self.xRange)
+
+    def seedStreams(self, seed):
+        self.seed(seed)
+        self.streamSeed = seed
+
+    # The generator of the draws at xValue.
+    def getRng(self, xValue):
+        if self.streamSeed is None:
+            return self.rng
+        if xValue not in self.streams:
+            self.streams[xValue] = numpy.random.default_rng((self.streamSeed, xValue))
+        return self.streams[xValue]
+
     #Re-initializes the environment from scratch
     #Returns True if reset successful, False otherwise
     def reset(self):
@@ -105,9 +258,34 @@ class DataDrivenEnv(MIEnvironment):
     # Guaranteed to be sampled from the distribution @ the passed in xValue.
     # Returns a y value and list storing a tuple of x and y values.
     def sample(self,xValue):
-        y = random.choice(self.allSamplesList[xValue])
+        if self.bufferSize <= 0:
+            y = float(self.sampleBlock(xValue, 1)[0])
+            return (y, [(xValue,y)])
+
+        position = self.bufferPositions[xValue]
+        if position == self.bufferSize:
+            self.buffers[xValue] = self.sampleBlock(xValue, self.bufferSize).tolist()
+            position = 0
+        y = self.buffers[xValue][position]
+        self.bufferPositions[xValue] = position + 1
         return (y, [(xValue,y)])
 
+    # Takes in a numpy array of xValues(int).
+    # Returns a numpy array holding one y value sampled at each of them.
+    def sampleMany(self, xValues):
+        picks = self.rng.integers(0, self.sampleCounts[xValues])
+        return self.sampleValues[self.sampleOffsets[xValues] + picks]
+
+    # Returns a numpy array of numSamples y values sampled at xValue.
+    def sampleBlock(self, xValue, numSamples):
+        picks = self.getRng(xValue).integers(0, self.sampleCounts[xValue], size=numSamples)
+        return self.sampleValues[self.sampleOffsets[xValue] + picks]
+
+    # Takes in a numpy array of xValues(int), e.g. one per simulated run.
+    # Returns a numpy array holding one y value sampled at each of them.
+    def sampleBatch(self, xValues):
+        return self.sampleMany(xValues)
+
     # Generates true function, (true mean yValues for all xValues).
     def generateTrueFunction(self):
         trueFunction = {}
@@ -115,6 +293,8 @@ class DataDrivenEnv(MIEnvironment):
             trueFunction[x] = self.yVals[x]
         return trueFunction
 
+    def getCacheKey(self):
+        return self.cacheKey
 
     def getXRange(self):
         return self.xRange
@@ -131,3 +311,154 @@ class DataDrivenEnv(MIEnvironment):
     
     
     
+
+
+# Abstract class.
+# An environment with a known parametric response curve over numX x values,
+# for measuring how the framework scales with the size of the domain.
+#
+# Subclasses define curve(positions), which maps positions in [0, 1] (x / (numX-1))
+# to values in [0, 1]; the curve is scaled to [minY, maxY] to give the mean
+# response.  Samples are drawn around the mean with one of these noise models:
+#   "gaussian":  mean + Normal(0, noiseScale * (maxY - minY)), clamped to [minY, maxY]
+#   "bernoulli": maxY with probability (mean - minY)/(maxY - minY), minY otherwise
+#                (like the 0/100 answers of the mental health survey)
+# generateTrueFunction gives the exact expected sample, clamping included.
+class SyntheticEnv(MIEnvironment):
+    def __init__(self, numX, noise="gaussian", noiseScale=0.1, minY=0.0, maxY=1.0, bufferSize=64, seed=None):
+        if noise not in ("gaussian", "bernoulli"):
+            raise ValueError("Unknown noise model '" + noise + "', expected gaussian or bernoulli")
+        self.xRange = range(numX)
+        self.noise = noise
+        self.noiseScale = noiseScale
+        self.miny = minY
+        self.maxy = maxY
+        positions = numpy.linspace(0.0, 1.0, numX) if numX > 1 else numpy.zeros(1)
+        self.means = minY + numpy.clip(self.curve(positions), 0.0, 1.0) * (maxY - minY)
+        self.stdDev = noiseScale * (maxY - minY)
+        self.bufferSize = bufferSize
+        self.seed(seed)
+        # The curve's parameters are all captured by the means.
+        self.cacheKey = (type(self).__name__, numX, noise, noiseScale, minY, maxY,
+                         hashlib.sha1(self.means.tobytes()).hexdigest())
+
+    # Takes a numpy array of positions in [0, 1], returns the curve there, in [0, 1].
+    def curve(self, positions):
+        pass
+
+    def reset(self):
+        return True
+
+    # Re-seeds the generator behind every draw, and drops any pre-drawn samples.
+    def seed(self, seed):
+        self.rng = numpy.random.default_rng(seed)
+        # Per-x generators, see seedStreams.
+        self.streamSeed = None
+        self.streams = {}
+        self.buffers = {}
+        self.bufferPositions = {}
+
+    def seedStreams(self, seed):
+        self.seed(seed)
+        self.streamSeed = seed
+
+    # The generator of the draws at xValue.
+    def getRng(self, xValue):
+        if self.streamSeed is None:
+            return self.rng
+        if xValue not in self.streams:
+            self.streams[xValue] = numpy.random.default_rng((self.streamSeed, xValue))
+        return self.streams[xValue]
+
+    def sample(self, xValue):
+        if self.bufferSize <= 0:
+            y = float(self.sampleBlock(xValue, 1)[0])
+            return (y, [(xValue,y)])
+
+        position = self.bufferPositions.get(xValue, self.bufferSize)
+        if position == self.bufferSize:
+            self.buffers[xValue] = self.sampleBlock(xValue, self.bufferSize).tolist()
+            position = 0
+        y = self.buffers[xValue][position]
+        self.bufferPositions[xValue] = position + 1
+        return (y, [(xValue,y)])
+
+    # Takes in a numpy array of xValues(int).
+    # Returns a numpy array holding one y value sampled at each of them.
+    def sampleMany(self, xValues):
+        return self._draw(self.means[xValues])
+
+    # Returns a numpy array of numSamples y values sampled at xValue.
+    def sampleBlock(self, xValue, numSamples):
+        return self._draw(numpy.full(numSamples, self.means[xValue]), self.getRng(xValue))
+
+    def sampleBatch(self, xValues):
+        return self.sampleMany(xValues)
+
+    def _draw(self, means, rng=None):
+        if rng is None:
+            rng = self.rng
+        if self.noise == "bernoulli":
+            p = (means - self.miny) / (self.maxy - self.miny)
+            return numpy.where(rng.random(len(means)) < p, self.maxy, self.miny)
+        return numpy.clip(rng.normal(means, self.stdDev), self.miny, self.maxy)
+
+    # Generates true function, (true mean yValues for all xValues).
+    def generateTrueFunction(self):
+        means = self.means
+        if self.noise == "gaussian" and self.stdDev > 0:
+            # Mean of a normal clamped to [miny, maxy]
+            alpha = (self.miny - means) / self.stdDev
+            beta = (self.maxy - means) / self.stdDev
+            means = self.miny * norm.cdf(alpha) + self.maxy * norm.sf(beta) + \
+                    means * (norm.cdf(beta) - norm.cdf(alpha)) + \
+                    self.stdDev * (norm.pdf(alpha) - norm.pdf(beta))
+        return dict(enumerate(means.tolist()))
+
+    def getCacheKey(self):
+        return self.cacheKey
+
+    def getXRange(self):
+        return self.xRange
+
+    def getMinSample(self):
+        return self.miny
+
+    def getMaxSample(self):
+        return self.maxy
+
+
+# A sine wave with the given number of periods across the domain.
+class SineEnv(SyntheticEnv):
+    def __init__(self, numX, periods=3, **kwargs):
+        self.periods = periods
+        SyntheticEnv.__init__(self, numX, **kwargs)
+
+    def curve(self, positions):
+        return 0.5 + 0.4 * numpy.sin(2 * numpy.pi * self.periods * positions)
+
+
+# Gaussian bumps of the given width (as a fraction of the domain) on a flat
+# baseline, centred at the given positions in [0, 1].
+class PeaksEnv(SyntheticEnv):
+    def __init__(self, numX, centers=(0.2, 0.5, 0.8), width=0.02, **kwargs):
+        self.centers = centers
+        self.width = width
+        SyntheticEnv.__init__(self, numX, **kwargs)
+
+    def curve(self, positions):
+        values = numpy.full(len(positions), 0.2)
+        for center in self.centers:
+            values += 0.6 * numpy.exp(-0.5 * ((positions - center) / self.width)**2)
+        return values
+
+
+# A smooth step from low to high around the given position in [0, 1].
+class LogisticEnv(SyntheticEnv):
+    def __init__(self, numX, center=0.5, steepness=20.0, **kwargs):
+        self.center = center
+        self.steepness = steepness
+        SyntheticEnv.__init__(self, numX, **kwargs)
+
+    def curve(self, positions):
+        return 0.1 + 0.8 / (1 + numpy.exp(-self.steepness * (positions - self.center)))
@@ -1,10 +1,13 @@
 import random
 import math
+import numpy
 import environments as envs
 import distributions as dists
 import visualizers as vis
 import utilities as util
+from sampleStore import SampleStore, LeastSampledTracker
 from cheater import Cheater
+import trueFunctionCache
 import sys
 import json
 
@@ -47,6 +50,22 @@ class Evaluator(object):
 
     def reset(self):
         pass
+
+    # Batched versions of the above, which evaluate numRuns independent runs at once.
+    def initBatch(self, env, numRuns):
+        pass
+
+    # Takes in numpy arrays holding one xValue(int) and one yValue(double) per run.
+    def processAISampleBatch(self, xValues, yValues):
+        pass
+
+    # Takes in keypoints shared by every run.
+    def processKeypointsBatch(self, currentKeypoints):
+        pass
+
+    # Returns a numpy array holding the current score of each run.
+    def getCurrentScoreBatch(self):
+        pass
     
 
 class RegretEvaluator(Evaluator, Cheater):
@@ -55,22 +74,24 @@ class RegretEvaluator(Evaluator, Cheater):
         pass
 
     def initWithEnvironment(self, env):
-        self.samples = [] 
+        self.samples = SampleStore(len(env.getXRange())) #intentionally NOT self.env
         self.score = 0
-        for i in env.getXRange(): #intentionally NOT self.env
-            self.samples.append([])
         # altEnv exists to make env.getXRange() accessible, later.    
         self.altEnv = env
         self.empKeypoints = []
+        self.scoreState = util.EvalScoreState(len(env.getXRange()), self.getScientistPreferredCILevel())
+        # Least sampled of the keypoints last passed to processKeypoints.
+        self.keypointTracker = None
+        self.trackedKeypoints = None
         return True
     
     def reset(self):
-        oldSamplesLen = len(self.samples)
-        self.samples = [] 
+        self.samples.reset()
         self.score = 0
-        for i in range(oldSamplesLen):
-            self.samples.append([])
         self.empKeypoints = []
+        self.scoreState.reset()
+        self.keypointTracker = None
+        self.trackedKeypoints = None
 
     def passTrueEnvironment(self, trueEnvironment):
         self.env = trueEnvironment
@@ -85,24 +106,43 @@ class RegretEvaluator(Evaluator, Cheater):
 
     def processAISample(self, xValue, yValue):
         self.lastXValue = xValue
-        self.samples[xValue].append(yValue)
+        self.lastYValue = yValue
+        self.samples.add(xValue, yValue)
+        self.scoreState.addSample(xValue)
+        if self.keypointTracker is not None and xValue in self.keypointTracker:
+            self.keypointTracker.increment(xValue)
 
+    # Removes the most recently processed sample, which was taken at xValue.
     def removeLastSample(self,xValue):
-        self.samples[xValue].pop()
+        self.samples.remove(xValue, self.lastYValue)
+        self.scoreState.removeSample(xValue)
+        if self.keypointTracker is not None and xValue in self.keypointTracker:
+            self.keypointTracker.decrement(xValue)
 
     def processEmpiricalKeypoints(self, currentKeypoints):
         self.empKeypoints = currentKeypoints
         self.empKeypointXs = [x for (x,y) in currentKeypoints]
         
     def processKeypoints(self, currentKeypoints):
-        newEmpScore = util.getEvalScore(self.samples, currentKeypoints, self.getScientistPreferredCILevel())
-        lastY = self.samples[self.lastXValue].pop()
-        optX = util.chooseOptimalXValue(currentKeypoints, self.samples)
-        self.samples[optX].append(1) # Exact Val doesn't matter
-        
-        newOptScore = util.getEvalScore(self.samples, currentKeypoints, self.getScientistPreferredCILevel())
-        self.samples[optX].pop()
-        self.samples[self.lastXValue].append(lastY)
+        # Score of the AI's samples, versus the score had the last sample
+        # gone to the least sampled keypoint instead.
+        self.scoreState.setKeypoints(currentKeypoints)
+        # graphs.py passes the same list every step, so the tracker is only
+        # rebuilt when the keypoints do change.
+        if currentKeypoints is not self.trackedKeypoints:
+            self.keypointTracker = LeastSampledTracker([x for (x, y) in currentKeypoints], self.scoreState.counts)
+            self.trackedKeypoints = currentKeypoints
+        newEmpScore = self.scoreState.score()
+        self.scoreState.removeSample(self.lastXValue)
+        lastIsKeypoint = self.lastXValue in self.keypointTracker
+        if lastIsKeypoint:
+            self.keypointTracker.decrement(self.lastXValue)
+        optX = self.keypointTracker.min()
+
+        newOptScore = self.scoreState.scoreIfAdded(optX)
+        self.scoreState.addSample(self.lastXValue)
+        if lastIsKeypoint:
+            self.keypointTracker.increment(self.lastXValue)
          
         regret = (newOptScore - newEmpScore)
         if regret < - 0.000001:
@@ -119,25 +159,72 @@ class RegretEvaluator(Evaluator, Cheater):
         return self.score
 
     def getEmpAlgScore(self):
-        return util.getEvalScore(self.samples, self.empKeypoints, self.getScientistPreferredCILevel())
+        empState = util.EvalScoreState(len(self.samples), self.getScientistPreferredCILevel())
+        empState.setCounts(self.samples.counts)
+        empState.setKeypoints(self.empKeypoints)
+        return empState.score()
 
     def getSampleCount(self):
         countDict = {}
         for x in self.altEnv.getXRange():
-            countDict[x] = len(self.samples[x])
+            countDict[x] = self.samples.count(x)
         return countDict
 
     def getNonKeypointSamples(self):
         total = 0
         for x in self.altEnv.getXRange():
             if x not in self.empKeypointXs:
-                total += len(self.samples[x])
+                total += self.samples.count(x)
         return total
 
     def estimateFunction(self):
      
-        func = self.env.generateTrueFunction()
+        func = trueFunctionCache.getTrueFunction(self.env)
         lowFunc = highFunc = func
        
         return (lowFunc,highFunc)
 
+    def initBatch(self, env, numRuns):
+        self.batchRows = numpy.arange(numRuns)
+        self.batchCounts = numpy.zeros((numRuns, len(env.getXRange())), dtype=numpy.int64)
+        self.batchScore = numpy.zeros(numRuns)
+        return True
+
+    def processAISampleBatch(self, xValues, yValues):
+        self.batchLastXValues = xValues
+        self.batchCounts[self.batchRows, xValues] += 1
+
+    def processKeypointsBatch(self, currentKeypoints):
+        """
+        Same as processKeypoints, for every run at once: the regret of each
+        run's last sample against the least sampled keypoint, with the score
+        computed as in util.getEvalScore.
+        """
+        keypointXes = numpy.array([x for (x, y) in currentKeypoints])
+        k = len(keypointXes)
+        ciNumerator = math.log(2/self.getScientistPreferredCILevel())
+        totalSamples = self.batchCounts.sum(axis=1)
+
+        keypointCounts = self.batchCounts[:, keypointXes]
+        CISum = numpy.sqrt(ciNumerator / (2*(keypointCounts + 0.01))).sum(axis=1)
+        penaltySum = totalSamples - keypointCounts.sum(axis=1)
+        newEmpScore = k/CISum - penaltySum
+
+        # Move each run's last sample to its least sampled keypoint.
+        keypointCounts -= (keypointXes[None, :] == self.batchLastXValues[:, None])
+        optIndex = numpy.argmin(keypointCounts, axis=1)
+        keypointCounts[self.batchRows, optIndex] += 1
+        CISum = numpy.sqrt(ciNumerator / (2*(keypointCounts + 0.01))).sum(axis=1)
+        penaltySum = totalSamples - keypointCounts.sum(axis=1)
+        newOptScore = k/CISum - penaltySum
+
+        regret = newOptScore - newEmpScore
+        if (regret < - 0.000001).any():
+            print("something's wrong with the score!")
+            print("regrets:", regret[regret < - 0.000001], "with", k, "keypoints:", list(keypointXes))
+            sys.exit(1)
+        self.batchScore = regret
+
+    def getCurrentScoreBatch(self):
+        return self.batchScore
+
@@ -0,0 +1,186 @@
+# Describes which simulations graphs.py runs.
+#
+# An experiment is a plain dictionary (so it can be stored as JSON and sent
+# to worker processes) holding:
+#   envs:        a list of environment specs, see DEFAULT_ENVS and SYNTHETIC_ENV_TYPES
+#   ais:         a list of AI names, see buildAI
+#   iterations:  runs averaged per (env, ai) cell
+#   askPeriod:   timesteps between calls to the human
+#   horizon:     if not None, overrides the tlimit of every environment spec
+# Only the environments, humans and AIs named by an experiment are ever built.
+
+import json
+import os
+import aiSampler as ais
+import humanSampler as hu
+import environments as envs
+
+
+# AI types by name.  An AI name is its type, optionally followed by "-" and
+# the value of the type's parameter, e.g. "TESA-10" or "Epsilon_Greedy-0.2".
+AI_TYPES = {
+    "Round_Robin": ais.RoundRobinSampler,
+    "Epsilon_Greedy": ais.EpsilonGreedyKeyPointSampler,
+    "Thompson": ais.SimpleNNTSSampler,
+    "UWPS": ais.UWPSSampler,
+    "TESA": ais.TESA,
+    "Optimal": ais.OptimalSampler,
+}
+
+# Parameter used when an AI name gives none.
+AI_DEFAULT_PARAMS = {
+    "Epsilon_Greedy": 0.1,
+}
+
+# Simulated human types by name, built from the "humanParams" of an environment spec.
+HUMAN_TYPES = {
+    "DifferenceBasedHuman": lambda distanceThresh: hu.DifferenceBasedHuman(hu.EmpTheoryGetter, distanceThresh),
+    "CriticalPointsHuman": hu.CriticalPointsHuman,
+    "SimilarPointsHuman": hu.SimilarPointsHuman,
+}
+
+# Synthetic environment types, for environment specs with a "synthetic" entry such as
+# {"envName": "Sine", "synthetic": {"type": "SineEnv", "numX": 10000, "noiseScale": 0.2}, ...}
+# The other entries of "synthetic" are passed to the constructor.
+SYNTHETIC_ENV_TYPES = {
+    "SineEnv": envs.SineEnv,
+    "PeaksEnv": envs.PeaksEnv,
+    "LogisticEnv": envs.LogisticEnv,
+}
+
+DEFAULT_AIS = ["Round_Robin", "Epsilon_Greedy", "Thompson", "UWPS", "TESA-0", "TESA-10", "TESA-20", "Optimal"]
+
+DEFAULT_ENVS = [
+    {"envName": "Economics", "dataset": "Data/Avocado/avocadoFile.json",
+     "human": "DifferenceBasedHuman", "humanParams": [100000], "tlimit": 10000},
+    {"envName": "Economics", "dataset": "Data/Avocado/avocadoFile.json",
+     "human": "CriticalPointsHuman", "humanParams": [0.7, 0.05], "tlimit": 10000},
+    {"envName": "Mental Health", "dataset": "Data/MentalHealth/mental_illness_file.json",
+     "human": "SimilarPointsHuman", "humanParams": [0.0, 0.33, 0.7], "tlimit": 10000},
+    {"envName": "Mental Health", "dataset": "Data/MentalHealth/mental_illness_file.json",
+     "human": "DifferenceBasedHuman", "humanParams": [50], "tlimit": 10000},
+    {"envName": "Psychology", "dataset": "Data/psych/psychData.json",
+     "human": "SimilarPointsHuman", "humanParams": [0.1, 0.5, 0.7], "tlimit": 10000},
+    {"envName": "Psychology", "dataset": "Data/psych/psychData.json",
+     "human": "CriticalPointsHuman", "humanParams": [0.7, 0.05], "tlimit": 10000},
+]
+
+DEFAULT_EXPERIMENT = {
+    "envs": DEFAULT_ENVS,
+    "ais": DEFAULT_AIS,
+    "iterations": 500,
+    "askPeriod": 100,
+    "horizon": None,
+}
+
+
+def buildAI(aiName):
+    (aiType, separator, param) = aiName.partition('-')
+    if aiType not in AI_TYPES:
+        raise ValueError("Unknown AI '" + aiName + "', expected one of " + ", ".join(AI_TYPES))
+    if param:
+        return AI_TYPES[aiType](json.loads(param))
+    if aiType in AI_DEFAULT_PARAMS:
+        return AI_TYPES[aiType](AI_DEFAULT_PARAMS[aiType])
+    return AI_TYPES[aiType]()
+
+def buildHuman(envSpec):
+    if envSpec["human"] not in HUMAN_TYPES:
+        raise ValueError("Unknown human '" + envSpec["human"] + "', expected one of " + ", ".join(HUMAN_TYPES))
+    return HUMAN_TYPES[envSpec["human"]](*envSpec["humanParams"])
+
+# DataDrivenEnvs built by buildEnv, by dataset path.  Environment specs with
+# the same dataset share one environment: runs re-seed it before use.
+_datasetEnvs = {}
+
+def buildEnv(envSpec):
+    if "synthetic" in envSpec:
+        params = dict(envSpec["synthetic"])
+        envType = params.pop("type")
+        if envType not in SYNTHETIC_ENV_TYPES:
+            raise ValueError("Unknown synthetic environment '" + envType + "', expected one of " + ", ".join(SYNTHETIC_ENV_TYPES))
+        return SYNTHETIC_ENV_TYPES[envType](**params)
+    datasetPath = os.path.abspath(envSpec["dataset"])
+    if datasetPath not in _datasetEnvs:
+        _datasetEnvs[datasetPath] = envs.DataDrivenEnv(envSpec["dataset"])
+    return _datasetEnvs[datasetPath]
+
+# The timestep limit of an environment spec within an experiment.
+def getTimeLimit(experiment, envSpec):
+    if experiment.get("horizon") is not None:
+        return experiment["horizon"]
+    return envSpec["tlimit"]
+
+
+# AI names for a parameter sweep, e.g. sweepAINames("TESA", [0, 5]) -> ["TESA-0", "TESA-5"]
+def sweepAINames(aiType, values):
+    if aiType not in AI_TYPES:
+        raise ValueError("Unknown AI type '" + aiType + "', expected one of " + ", ".join(AI_TYPES))
+    return [aiType + "-" + json.dumps(value) for value in values]
+
+
+def makeExperiment(config=None, envNames=None, humanNames=None, aiNames=None, sweeps=None,
+                   iterations=None, horizon=None, askPeriod=None):
+    """
+    Returns an experiment built from DEFAULT_EXPERIMENT, then the settings of
+    config (a dictionary, e.g. loaded from a JSON config file), then the
+    keyword arguments, each overriding the ones before.
+
+    config may hold any experiment key, plus the keyword arguments' names.
+    envNames and humanNames keep only the environment specs with those names.
+    No two environment specs may have the same envName and human, since
+    results and checkpoints are keyed on them.
+    aiNames selects AIs by name.  sweeps maps an AI type to a list of
+    parameter values, e.g. {"TESA": [0, 5, 10]}; the swept AIs are added to
+    the selected AIs, or replace the default AIs if none were selected.
+    """
+    settings = {}
+    if config is not None:
+        settings.update(config)
+    overrides = {"envNames": envNames, "humanNames": humanNames, "aiNames": aiNames, "sweeps": sweeps,
+                 "iterations": iterations, "horizon": horizon, "askPeriod": askPeriod}
+    for key in overrides:
+        if overrides[key] is not None:
+            settings[key] = overrides[key]
+
+    experiment = dict(DEFAULT_EXPERIMENT)
+    for key in DEFAULT_EXPERIMENT:
+        if key in settings:
+            experiment[key] = settings[key]
+
+    envSpecs = experiment["envs"]
+    if settings.get("envNames") is not None:
+        envSpecs = [s for s in envSpecs if s["envName"] in settings["envNames"]]
+    if settings.get("humanNames") is not None:
+        envSpecs = [s for s in envSpecs if s["human"] in settings["humanNames"]]
+    if len(envSpecs) == 0:
+        raise ValueError("No environment matches the selected environments and humans")
+    cellNames = set()
+    for envSpec in envSpecs:
+        if (envSpec["envName"], envSpec["human"]) in cellNames:
+            raise ValueError("Two environment specs have envName '" + envSpec["envName"] + "' and human '" +
+                             envSpec["human"] + "'; give them different envNames")
+        cellNames.add((envSpec["envName"], envSpec["human"]))
+    experiment["envs"] = envSpecs
+
+    selectedAIs = settings.get("aiNames")
+    sweepNames = []
+    for aiType in settings.get("sweeps") or {}:
+        sweepNames += sweepAINames(aiType, settings["sweeps"][aiType])
+    if selectedAIs is None:
+        selectedAIs = experiment["ais"] if len(sweepNames) == 0 else []
+    experiment["ais"] = list(selectedAIs) + [n for n in sweepNames if n not in selectedAIs]
+    for aiName in experiment["ais"]:
+        buildAI(aiName) # fail early on unknown names
+    return experiment
+
+def loadConfig(configPath):
+    with open(configPath, 'r') as f:
+        return json.load(f)
+
+# Parses "TESA=0,5,10" into ("TESA", [0, 5, 10])
+def parseSweep(sweepStr):
+    (aiType, separator, values) = sweepStr.partition('=')
+    if not separator:
+        raise ValueError("Sweeps look like TYPE=v1,v2,..., got '" + sweepStr + "'")
+    return (aiType, [json.loads(v) for v in values.split(',')])
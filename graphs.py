@@ -1,19 +1,27 @@
 # This script runs simulations to compare AI algorithms.
 
 from matplotlib import pyplot as plt
-import aiSampler as ais
-import humanSampler as hu
 import environments as envs
 import evaluators as eval
 import cheater
 import random
+import numpy
 import json
-import os, sys
+import os, re
 import statsTrack as stat
+import checkpoint
+import profiling
+import resultsStore
+import trueFunctionCache
+import experimentConfig as config
+import argparse
+import cProfile
+import pstats
+from concurrent.futures import ProcessPoolExecutor
 
 
 def createVisualizationJson(lofunc,func,hifunc, t, envName, aiName, minValue, maxValue):
-    dictionary = {'lofunc':lofunc, 'func':func, 'hifunc':hifunc, 'maxValue':maxValue, 'minValue':minValue}
+    dictionary = {'lofunc':dict(lofunc), 'func':dict(func), 'hifunc':dict(hifunc), 'maxValue':maxValue, 'minValue':minValue}
     fileName = envName+'_'+aiName+'_'+str(t)+'.json'
     f = open('jsons'+os.sep+fileName, 'w')
     json.dump(dictionary, f)
@@ -31,204 +39,792 @@ def getInitialSamples(env, numSamples):
     return ret
 
 
-#Each graph is averaged over this many runs
+#Each graph is averaged over this many runs (set by configure)
 NUM_ITERATIONS = 500
 
 # Boolean flag that will tell the function whether
 # to call out to the human for keypoints.
 EVAL_IMMEDIATELY = True
 
-# System will ask for human feedback after this many runs in the main loop.
+# System will ask for human feedback after this many runs in the main loop (set by configure).
 ASK_PERIOD = 100
 
 visualizeJson = False
-epsilon = 0.1
-
-#AI Tuples list (modified)
-aiTuples =  [
-                (ais.RoundRobinSampler(), "Round_Robin"),
-                (ais.EpsilonGreedyKeyPointSampler(epsilon), "Epsilon_Greedy"),
-                (ais.SimpleNNTSSampler(), "Thompson"),
-                (ais.UWPSSampler(), "UWPS"),
-                (ais.TESA(0), "TESA-0"),
-                (ais.TESA(10), "TESA-10"),
-                (ais.TESA(20), "TESA-20"),
-                (ais.OptimalSampler(), "Optimal")
-            ]
-
-# Modified Environment Tuples list.
-envTuples = [
-                (
-                    envs.DataDrivenEnv("Data/Avocado/avocadoFile.json"),
-                    "Economics",
-                    hu.DifferenceBasedHuman(hu.EmpTheoryGetter,100000),
-                    "DifferenceBasedHuman",
-                    10000
-                ),
-                (
-                    envs.DataDrivenEnv("Data/Avocado/avocadoFile.json"),
-                    "Economics",
-                    hu.CriticalPointsHuman(0.7, 0.05),
-                    "CriticalPointsHuman",
-                    10000
-                ),
-                (
-                    envs.DataDrivenEnv("Data/MentalHealth/mental_illness_file.json"),
-                    "Mental Health",
-                    hu.SimilarPointsHuman(0.0,0.33, 0.7),
-                    "SimilarPointsHuman",
-                    10000
-                ),
-                (
-                    envs.DataDrivenEnv("Data/MentalHealth/mental_illness_file.json"),
-                    "Mental Health",
-                    hu.DifferenceBasedHuman(hu.EmpTheoryGetter,50),
-                    "DifferenceBasedHuman",
-                    10000
-                ),
-                (
-                    envs.DataDrivenEnv("Data/psych/psychData.json"),
-                    "Psychology",
-                    hu.SimilarPointsHuman(0.1,0.5, 0.7),
-                    "SimilarPointsHuman",
-                    10000
-                ),
-                (
-                    envs.DataDrivenEnv("Data/psych/psychData.json"),
-                    "Psychology",
-                    hu.CriticalPointsHuman(0.7,0.05),
-                    "CriticalPointsHuman",
-                    10000
-                )
-            ]
-
-if __name__ == "__main__":
-    random.seed(8721783) #Reproducibility
-    humanTuples = []
-    evalTuples = []
-    results = []
-    env_num=0
-    ai_num =0
-    allResults = {}
-
-    ################### ENV LOOP START ################################################################################
-
-    for env, envName, human, humanName, tlimit in envTuples:
-        env_num+=1
-        trange = range(tlimit)
-        envReady = env.reset()
-        if not envReady:
-            print("Environment not ready, returning to top of loop.")
-            continue
 
+# Every per-environment and per-iteration seed is derived from this one.
+BASE_SEED = 8721783
+
+# Number of worker processes used to run the simulation grid.
+# None means one worker per core, 1 runs everything in this process.
+NUM_WORKERS = None
+
+# Iterations handed to a worker at a time.  This is deliberately independent
+# of NUM_WORKERS: chunks are always merged in the same order, so
+# allResults.json does not change with the number of workers.
+CHUNK_SIZE = 25
+
+# If True, AIs that support it (see AISampler.supportsBatch) simulate all
+# NUM_ITERATIONS runs of a cell at once on numpy arrays, rather than one
+# run at a time.  Requires EVAL_IMMEDIATELY.
+BATCH_MODE = True
+
+# Number of experiments run at once (instrument slots).  Above 1, each
+# timestep fills every slot with one call to AISampler.chooseXValues, and
+# results hold the cumulative regret after each batch (see runSlotIterations).
+SLOTS = 1
+
+# Opt-in instrumentation (see profiling.py).  With PROFILE, the time spent in
+# each phase of the simulation loop is recorded per cell (and, with
+# PROFILE_MEMORY, the peak memory allocated in each phase), see
+# writeProfileReport.  CPROFILE_CELL, an (envName, humanName, aiName) tuple,
+# also runs that cell under cProfile and saves the stats to PROFILE_DIRECTORY.
+PROFILE = False
+PROFILE_MEMORY = False
+
+# Common random numbers: if True, every AI of an environment sees the same
+# samples in the same iteration (the n-th sample at each x is the same, see
+# MIEnvironment.seedStreams), and runGrid also computes paired differences
+# between the AIs (see pairedResults).  Uses the one-run-at-a-time loop.
+COMMON_RANDOM_NUMBERS = False
+CPROFILE_CELL = None
+PROFILE_DIRECTORY = "."
+
+# The experiment being run (see experimentConfig); set by configure.
+# envSpecs and aiNames are the environments and AIs it selects.
+experiment = None
+envSpecs = []
+aiNames = []
+
+def configure(newExperiment):
+    """
+    Selects the experiment to run.  Worker processes are configured with
+    the same experiment when the pool starts them.
+    """
+    global experiment, envSpecs, aiNames, NUM_ITERATIONS, ASK_PERIOD
+    experiment = newExperiment
+    envSpecs = experiment["envs"]
+    aiNames = experiment["ais"]
+    NUM_ITERATIONS = experiment["iterations"]
+    ASK_PERIOD = experiment["askPeriod"]
+    _envTuples.clear()
+    _aiTuples.clear()
+    _preparedEnvs.clear()
+
+
+# Objects built by this process, keyed by index into envSpecs / aiNames.
+_envTuples = {}
+_aiTuples = {}
+
+def getEnvTuple(envIndex):
+    """
+    Returns (env, envName, human, humanName, tlimit) for envSpecs[envIndex],
+    building the environment and human the first time they are needed.
+    """
+    if envIndex not in _envTuples:
+        envSpec = envSpecs[envIndex]
+        _envTuples[envIndex] = (config.buildEnv(envSpec), envSpec["envName"], config.buildHuman(envSpec),
+                                envSpec["human"], config.getTimeLimit(experiment, envSpec))
+    return _envTuples[envIndex]
+
+# Returns (ai, aiName) for aiNames[aiIndex], building the AI the first time it is needed.
+def getAITuple(aiIndex):
+    if aiIndex not in _aiTuples:
+        _aiTuples[aiIndex] = (config.buildAI(aiNames[aiIndex]), aiNames[aiIndex])
+    return _aiTuples[aiIndex]
+
+def deriveSeed(*parts):
+    """
+    Returns a 32 bit seed determined only by BASE_SEED and parts,
+    e.g. deriveSeed(envName, humanName, aiName, it).
+    String seeds are hashed with sha512 by random.Random, so the
+    result is the same in every process and every Python run.
+    """
+    return random.Random(repr((BASE_SEED,) + parts)).getrandbits(32)
+
+def seedAll(seed):
+    # The samplers draw from both random and numpy.random.
+    random.seed(seed)
+    numpy.random.seed(seed)
+
+
+# Environments prepared by this process, keyed by index into envSpecs.
+_preparedEnvs = {}
+
+def prepareEnvironment(envIndex):
+    """
+    Runs the per-environment setup (initial samples and true keypoints)
+    for envSpecs[envIndex].  The setup is seeded from the environment and
+    human names, so every worker process computes the same result.
+    Returns (initSamples, trueKeypointsList, evaluator), or None if the
+    environment or human could not be initialized.
+    """
+    if envIndex in _preparedEnvs:
+        return _preparedEnvs[envIndex]
+
+    env, envName, human, humanName, tlimit = getEnvTuple(envIndex)
+    seedAll(deriveSeed(envName, humanName))
+    env.seed(deriveSeed(envName, humanName))
+    prepared = None
+    envReady = env.reset()
+    if not envReady:
+        print("Environment not ready, returning to top of loop.")
+    elif human.initWithEnvironment(envs.MIEnvironmentInfo(env)): #Boolean, can be True or False.
         evaluator = eval.RegretEvaluator()
-        
+
         if isinstance(evaluator, cheater.Cheater):
             evaluator.passTrueEnvironment(env)
 
-        huInited = human.initWithEnvironment(envs.MIEnvironmentInfo(env)) #Boolean, can be True or False.
-        if not huInited:
-            continue
-
         initSamples = getInitialSamples(env, 10)
         theory = human.buildTheoryFromInitialSamples(initSamples)
 
         evaluator.initWithEnvironment(envs.MIEnvironmentInfo(env))
 
-        (loEvalFunc, hiEvalFunc) = evaluator.estimateFunction()
-        trueKeypointsList = human.getUpdatedKeypoints(loEvalFunc, hiEvalFunc)
+        trueKeypointsList = trueFunctionCache.getTrueKeypoints(env, human)
         while len(trueKeypointsList) == 0:
             human.tagOut()
             initSamples = getInitialSamples(env, 10)
             theory = human.buildTheoryFromInitialSamples(initSamples)
-            (loEvalFunc, hiEvalFunc) = evaluator.estimateFunction()
-            trueKeypointsList = human.getUpdatedKeypoints(loEvalFunc, hiEvalFunc)
-
-        ################################## AI LOOP START ########################################################
-
-        for ai,aiName in aiTuples:
-            ai_num += 1
-            print("Human: ", humanName, "\nAI: ", aiName)
-            iterationCounter = 0
-            failed = False
-            totalLearnerResults = [0.0] * len(trange)
-            allLearnerResults = []
-            for t in trange:
-                allLearnerResults.append(stat.StatsTracker())
-
-            ####################### NUM ITERATIONS LOOP START ##############################################
-            for it in range(NUM_ITERATIONS):
-                iterationCounter += 1
-                percentComplete = 100 * iterationCounter/NUM_ITERATIONS
-                print("loading: ", percentComplete, "%" )
-
-
-
-                ############################# RESET / INIT #############################
-
-                # Set up the learner and the environment
-                env.reset()
-                evaluator.reset()
-                human.tagOut()
-                theory = human.buildTheoryFromInitialSamples(initSamples)
-                ai.processPriorTheory(theory)
-
-                inited = ai.initWithEnvironment(envs.MIEnvironmentInfo(env)) # Boolean, can be True or False.
-                if not inited:
-                    failed = True
-                    break
-
-                if isinstance(ai, cheater.Cheater):
-                    ai.passTrueEnvironment(env)
-                    ai.passTrueHuman(human)
-
-                cumulativeScore = 0.0
-
-                ########################################################### MAIN LOOP START #############################################################
-                for t in trange:
-
-                    chosenX = ai.chooseXValue()
-                    (yValue, toProcess) = env.sample(chosenX)
-
-                    # toProcess is a list.
-                    for (xValue, yValue) in toProcess:
-                        ai.processSample(xValue, yValue)
-                        evaluator.processAISample(xValue, yValue)
-
-                    # If True, call out to human for keypoints.
-                    if EVAL_IMMEDIATELY:
-                        evaluator.processKeypoints(trueKeypointsList)
-
-                    if t % ASK_PERIOD == ASK_PERIOD - 1:
-                        (lofunc,func,hifunc) = ai.generateVisualization()
-                        minValue = env.getMinSample()
-                        maxValue = env.getMaxSample()
-                        if it==0 and visualizeJson==True and env_num==1 and ai_num==1:
-                            createVisualizationJson(lofunc, func, hifunc, t, envName, aiName, minValue, maxValue)
-                        keypointList = human.getUpdatedKeypoints(lofunc, hifunc)
-
-                        ai.processKeyPoints(keypointList)
-                        evaluator.processEmpiricalKeypoints(keypointList)
-
-                        # In reality, getting keypoints will only occur once for human and evals.
-                        if not EVAL_IMMEDIATELY:
-                            (loEvalFunc, hiEvalFunc) = evaluator.estimateFunction()
-                            keypointsList = human.getUpdatedKeypoints(loEvalFunc, hiEvalFunc)
-                            evaluator.processKeypoints(keypointsList)
-
-                    # Evaluator score only updates when a new keypoint updates.
-                    cumulativeScore += evaluator.getCurrentScore()
-                    totalLearnerResults[t] += cumulativeScore
-                    allLearnerResults[t].update(cumulativeScore)
-
-            if failed: # due to unimplemented learner
+            trueKeypointsList = trueFunctionCache.getTrueKeypoints(env, human)
+        prepared = (initSamples, trueKeypointsList, evaluator)
+
+    _preparedEnvs[envIndex] = prepared
+    return prepared
+
+
+def startIteration(envIndex, aiIndex, it):
+    """
+    Seeds iteration it of one (environment, AI) cell from (env, human, ai,
+    iteration) and resets the environment, the evaluator, the human and
+    the AI for it.  prepareEnvironment(envIndex) must have succeeded.
+    Returns False if the learner could not be initialized.
+    """
+    (initSamples, trueKeypointsList, evaluator) = prepareEnvironment(envIndex)
+    env, envName, human, humanName, tlimit = getEnvTuple(envIndex)
+    ai, aiName = getAITuple(aiIndex)
+    seedAll(deriveSeed(envName, humanName, aiName, it))
+    env.seed(deriveSeed(envName, humanName, aiName, it))
+    if COMMON_RANDOM_NUMBERS:
+        # The same for every AI.
+        env.seedStreams(deriveSeed(envName, humanName, 'crn', it))
+
+    ############################# RESET / INIT #############################
+
+    # Set up the learner and the environment
+    env.reset()
+    evaluator.reset()
+    human.tagOut()
+    theory = human.buildTheoryFromInitialSamples(initSamples)
+    ai.processPriorTheory(theory)
+
+    inited = ai.initWithEnvironment(envs.MIEnvironmentInfo(env)) # Boolean, can be True or False.
+    if not inited:
+        return False
+
+    if isinstance(ai, cheater.Cheater):
+        ai.passTrueEnvironment(env)
+        ai.passTrueHuman(human)
+    return True
+
+def runIterations(envIndex, aiIndex, iterations, timer=profiling.NULL_TIMER, trajectories=None):
+    """
+    Runs the given iterations of one (environment, AI) cell and returns a
+    StatsTrackerArray of cumulative regret per timestep, or
+    None if the environment or the learner could not be initialized.
+    Each iteration is seeded from (env, human, ai, iteration) alone.
+    The time spent in each phase of the loop is added to timer, and the
+    cumulative regret of each iteration is appended to trajectories, if given.
+    """
+    prepared = prepareEnvironment(envIndex)
+    if prepared is None:
+        return None
+    (initSamples, trueKeypointsList, evaluator) = prepared
+    env, envName, human, humanName, tlimit = getEnvTuple(envIndex)
+    ai, aiName = getAITuple(aiIndex)
+    trange = range(tlimit)
+
+    learnerResults = stat.StatsTrackerArray(tlimit)
+    trajectory = numpy.zeros(tlimit)
+
+    ####################### NUM ITERATIONS LOOP START ##############################################
+    for it in iterations:
+        timer.start()
+        inited = startIteration(envIndex, aiIndex, it)
+        timer.mark('startIteration')
+        if not inited:
+            return None
+
+        cumulativeScore = 0.0
+
+        ########################################################### MAIN LOOP START #############################################################
+        for t in trange:
+
+            chosenX = ai.chooseXValue()
+            timer.mark('ai.chooseXValue')
+            (yValue, toProcess) = env.sample(chosenX)
+            timer.mark('env.sample')
+
+            # toProcess is a list.
+            for (xValue, yValue) in toProcess:
+                ai.processSample(xValue, yValue)
+                timer.mark('ai.processSample')
+                evaluator.processAISample(xValue, yValue)
+                timer.mark('evaluator.processAISample')
+
+            # If True, call out to human for keypoints.
+            if EVAL_IMMEDIATELY:
+                evaluator.processKeypoints(trueKeypointsList)
+                timer.mark('evaluator.processKeypoints')
+
+            if t % ASK_PERIOD == ASK_PERIOD - 1:
+                (lofunc,func,hifunc) = ai.generateVisualization()
+                timer.mark('ai.generateVisualization')
+                minValue = env.getMinSample()
+                maxValue = env.getMaxSample()
+                if it==0 and visualizeJson==True and envIndex==0 and aiIndex==0:
+                    createVisualizationJson(lofunc, func, hifunc, t, envName, aiName, minValue, maxValue)
+                    timer.mark('createVisualizationJson')
+                keypointList = human.getUpdatedKeypointsArray(lofunc, hifunc)
+                timer.mark('human.getUpdatedKeypoints')
+
+                ai.processKeyPoints(keypointList)
+                timer.mark('ai.processKeyPoints')
+                evaluator.processEmpiricalKeypoints(keypointList)
+                timer.mark('evaluator.processEmpiricalKeypoints')
+
+                # In reality, getting keypoints will only occur once for human and evals.
+                if not EVAL_IMMEDIATELY:
+                    keypointsList = trueFunctionCache.getTrueKeypoints(env, human)
+                    evaluator.processKeypoints(keypointsList)
+                    timer.mark('evaluator.processTrueKeypoints')
+
+            # Evaluator score only updates when a new keypoint updates.
+            cumulativeScore += evaluator.getCurrentScore()
+            trajectory[t] = cumulativeScore
+            timer.mark('evaluator.getCurrentScore')
+
+        learnerResults.update(trajectory)
+        if trajectories is not None:
+            trajectories.append(trajectory.copy())
+
+    return learnerResults
+
+def runBatchIterations(envIndex, aiIndex, iterations, timer=profiling.NULL_TIMER):
+    """
+    Same as runIterations, but simulates all the given iterations together
+    through the AI's batched interface (chooseXBatch, processSampleBatch, ...),
+    so each timestep is a handful of numpy operations over every run.
+    The batch is seeded from (env, human, ai, first iteration).
+    """
+    prepared = prepareEnvironment(envIndex)
+    if prepared is None:
+        return None
+    (initSamples, trueKeypointsList, evaluator) = prepared
+    env, envName, human, humanName, tlimit = getEnvTuple(envIndex)
+    ai, aiName = getAITuple(aiIndex)
+    numRuns = len(iterations)
+    timer.start()
+    seedAll(deriveSeed(envName, humanName, aiName, 'batch', iterations.start))
+    env.seed(deriveSeed(envName, humanName, aiName, 'batch', iterations.start))
+
+    ############################# RESET / INIT #############################
+    env.reset()
+    evaluator.initBatch(envs.MIEnvironmentInfo(env), numRuns)
+    human.tagOut()
+    theory = human.buildTheoryFromInitialSamples(initSamples)
+    ai.processPriorTheory(theory)
+
+    inited = ai.initBatch(envs.MIEnvironmentInfo(env), numRuns)
+    if not inited:
+        return None
+
+    if isinstance(ai, cheater.Cheater):
+        ai.passTrueEnvironment(env)
+        ai.passTrueHuman(human)
+
+    learnerResults = stat.StatsTrackerArray(tlimit)
+    cumulativeScores = numpy.zeros(numRuns)
+    timer.mark('startIteration')
+
+    ########################################################### MAIN LOOP START #############################################################
+    for t in range(tlimit):
+        chosenXs = ai.chooseXBatch()
+        timer.mark('ai.chooseXBatch')
+        yValues = env.sampleBatch(chosenXs)
+        timer.mark('env.sampleBatch')
+        ai.processSampleBatch(chosenXs, yValues)
+        timer.mark('ai.processSampleBatch')
+        evaluator.processAISampleBatch(chosenXs, yValues)
+        timer.mark('evaluator.processAISampleBatch')
+        evaluator.processKeypointsBatch(trueKeypointsList)
+        timer.mark('evaluator.processKeypointsBatch')
+
+        if t % ASK_PERIOD == ASK_PERIOD - 1:
+            (lofuncs, funcs, hifuncs) = ai.generateVisualizationBatch()
+            timer.mark('ai.generateVisualizationBatch')
+            keypointLists = []
+            for run in range(numRuns):
+                if iterations[run]==0 and visualizeJson==True and envIndex==0 and aiIndex==0:
+                    (lofunc, func, hifunc) = [dict(enumerate(f[run].tolist())) for f in (lofuncs, funcs, hifuncs)]
+                    createVisualizationJson(lofunc, func, hifunc, t, envName, aiName, env.getMinSample(), env.getMaxSample())
+                    timer.mark('createVisualizationJson')
+                keypointLists.append(human.getUpdatedKeypointsArray(lofuncs[run], hifuncs[run]))
+                timer.mark('human.getUpdatedKeypoints')
+            ai.processKeyPointsBatch(keypointLists)
+            timer.mark('ai.processKeyPointsBatch')
+
+        cumulativeScores += evaluator.getCurrentScoreBatch()
+        learnerResults.updateBatch(t, cumulativeScores)
+        timer.mark('evaluator.getCurrentScoreBatch')
+
+    return learnerResults
+
+def runSlotIterations(envIndex, aiIndex, iterations, timer=profiling.NULL_TIMER, trajectories=None):
+    """
+    Same as runIterations, but with SLOTS experiments run at once: each
+    timestep the AI chooses SLOTS x values in one call to chooseXValues,
+    all of them are sampled, and the regret is counted once per batch.
+    tlimit is still the number of samples, so there are
+    ceil(tlimit / SLOTS) timesteps.  The human is asked for keypoints
+    whenever another ASK_PERIOD samples have been taken.
+    """
+    prepared = prepareEnvironment(envIndex)
+    if prepared is None:
+        return None
+    (initSamples, trueKeypointsList, evaluator) = prepared
+    env, envName, human, humanName, tlimit = getEnvTuple(envIndex)
+    ai, aiName = getAITuple(aiIndex)
+    numBatches = getNumTimesteps(tlimit)
+
+    learnerResults = stat.StatsTrackerArray(numBatches)
+    trajectory = numpy.zeros(numBatches)
+
+    for it in iterations:
+        timer.start()
+        inited = startIteration(envIndex, aiIndex, it)
+        timer.mark('startIteration')
+        if not inited:
+            return None
+
+        cumulativeScore = 0.0
+        samplesTaken = 0
+        for t in range(numBatches):
+            slots = min(SLOTS, tlimit - samplesTaken)
+            chosenXs = ai.chooseXValues(slots)
+            timer.mark('ai.chooseXValues')
+            for chosenX in chosenXs:
+                (yValue, toProcess) = env.sample(chosenX)
+                timer.mark('env.sample')
+                for (xValue, yValue) in toProcess:
+                    ai.processSample(xValue, yValue)
+                    timer.mark('ai.processSample')
+                    evaluator.processAISample(xValue, yValue)
+                    timer.mark('evaluator.processAISample')
+            previousAsks = samplesTaken // ASK_PERIOD
+            samplesTaken += slots
+
+            if EVAL_IMMEDIATELY:
+                evaluator.processKeypoints(trueKeypointsList)
+                timer.mark('evaluator.processKeypoints')
+
+            if samplesTaken // ASK_PERIOD > previousAsks:
+                (lofunc,func,hifunc) = ai.generateVisualization()
+                timer.mark('ai.generateVisualization')
+                keypointList = human.getUpdatedKeypointsArray(lofunc, hifunc)
+                timer.mark('human.getUpdatedKeypoints')
+                ai.processKeyPoints(keypointList)
+                timer.mark('ai.processKeyPoints')
+                evaluator.processEmpiricalKeypoints(keypointList)
+                timer.mark('evaluator.processEmpiricalKeypoints')
+                if not EVAL_IMMEDIATELY:
+                    evaluator.processKeypoints(trueFunctionCache.getTrueKeypoints(env, human))
+                    timer.mark('evaluator.processTrueKeypoints')
+
+            # Regret per batch: every slot waited for the same state.
+            cumulativeScore += evaluator.getCurrentScore()
+            trajectory[t] = cumulativeScore
+            timer.mark('evaluator.getCurrentScore')
+
+        learnerResults.update(trajectory)
+        if trajectories is not None:
+            trajectories.append(trajectory.copy())
+
+    return learnerResults
+
+# Number of timesteps (batches of SLOTS samples) in a run of tlimit samples.
+def getNumTimesteps(tlimit):
+    return -(-tlimit // SLOTS)
+
+# Returns the name of the loop that runs the given cell.
+def getEngine(aiIndex):
+    if SLOTS > 1:
+        return 'slots'
+    if BATCH_MODE and EVAL_IMMEDIATELY and not COMMON_RANDOM_NUMBERS and getAITuple(aiIndex)[0].supportsBatch():
+        return 'batch'
+    return 'serial'
+
+def _runTask(task):
+    """
+    Runs a chunk of iterations of a cell and returns (results, timer,
+    profilePath, trajectories): the StatsTrackerArray (or None), the
+    PhaseTimer if PROFILE is on (else None), the cProfile stats file
+    written for CPROFILE_CELL (else None), and with COMMON_RANDOM_NUMBERS
+    the cumulative regret of each iteration as an array of shape
+    (iterations, timesteps) (else None).
+    """
+    (envIndex, aiIndex, iterations) = task
+    timer = profiling.PhaseTimer(PROFILE_MEMORY) if PROFILE else profiling.NULL_TIMER
+    profiler = None
+    if CPROFILE_CELL is not None and _cellNames(envIndex)[:2] + (aiNames[aiIndex],) == tuple(CPROFILE_CELL):
+        profiler = cProfile.Profile()
+        profiler.enable()
+    trajectories = [] if COMMON_RANDOM_NUMBERS else None
+    try:
+        engine = getEngine(aiIndex)
+        if engine == 'slots':
+            results = runSlotIterations(envIndex, aiIndex, iterations, timer, trajectories)
+        elif engine == 'batch':
+            results = runBatchIterations(envIndex, aiIndex, iterations, timer)
+        else:
+            results = runIterations(envIndex, aiIndex, iterations, timer, trajectories)
+    finally:
+        timer.stop()
+        if profiler is not None:
+            profiler.disable()
+
+    profilePath = None
+    if profiler is not None:
+        os.makedirs(PROFILE_DIRECTORY, exist_ok=True)
+        profilePath = os.path.join(PROFILE_DIRECTORY, 'cell.' + str(iterations.start) + '.' + str(os.getpid()) + '.prof.tmp')
+        profiler.dump_stats(profilePath)
+    if results is None or trajectories is None:
+        trajectories = None
+    else:
+        trajectories = numpy.array(trajectories)
+    return (results, timer if PROFILE else None, profilePath, trajectories)
+
+
+# Module settings that pool workers copy from this process.
+def _workerSettings():
+    return {'SLOTS': SLOTS, 'PROFILE': PROFILE, 'PROFILE_MEMORY': PROFILE_MEMORY,
+            'CPROFILE_CELL': CPROFILE_CELL, 'PROFILE_DIRECTORY': PROFILE_DIRECTORY,
+            'COMMON_RANDOM_NUMBERS': COMMON_RANDOM_NUMBERS}
+
+# Sets up a pool worker process like this one.
+def _initWorker(newExperiment, trueFunctionCacheDirectory, settings):
+    configure(newExperiment)
+    trueFunctionCache.CACHE_DIRECTORY = trueFunctionCacheDirectory
+    globals().update(settings)
+
+
+# (envName, humanName, tlimit) of envSpecs[envIndex], without building anything.
+def _cellNames(envIndex):
+    envSpec = envSpecs[envIndex]
+    return (envSpec["envName"], envSpec["human"], config.getTimeLimit(experiment, envSpec))
+
+
+def runGrid(numWorkers=NUM_WORKERS, checkpoints=None, resume=False, checkpointEvery=None):
+    """
+    Runs every (environment, AI) cell for NUM_ITERATIONS iterations, split
+    into CHUNK_SIZE chunks spread over numWorkers processes, and returns
+    the allResults dictionary written to allResults.json.
+
+    If checkpoints (a checkpoint.CheckpointStore) is given, each cell is
+    saved there as soon as it finishes, and unfinished cells save their
+    merged trackers at least every checkpointEvery iterations (if given).
+    With resume, finished cells are loaded instead of run and unfinished
+    cells continue from their last saved chunk.  Iterations are seeded
+    from their names, so a resumed run gives the same results as an
+    uninterrupted one.
+
+    With PROFILE, the per-cell timers are kept in cellProfiles (see
+    writeProfileReport).  With COMMON_RANDOM_NUMBERS, the paired
+    differences between AIs are kept in pairedResults.
+    """
+    cellProfiles.clear()
+    pairedResults.clear()
+    pairTrackers = {}
+    pairChunks = {}
+    profilePaths = []
+    tasks = []
+    cellOutputs = {}
+    cellResults = {}
+    lastSaved = {}
+    for envIndex in range(len(envSpecs)):
+        (envName, humanName, tlimit) = _cellNames(envIndex)
+        for aiIndex in range(len(aiNames)):
+            aiName = aiNames[aiIndex]
+            cell = (envIndex, aiIndex)
+            firstIteration = 0
+            if resume and checkpoints is not None:
+                finished = checkpoints.loadFinished(envSpecs[envIndex], aiName)
+                if finished is not None and len(finished) == getNumTimesteps(tlimit):
+                    print("Resuming: ", envName, humanName, aiName, "already finished.")
+                    cellOutputs[cell] = finished
+                    continue
+                partial = checkpoints.loadPartial(envSpecs[envIndex], aiName)
+                if partial is not None and len(partial[1]) == getNumTimesteps(tlimit):
+                    (firstIteration, cellResults[cell]) = partial
+                    print("Resuming: ", envName, humanName, aiName, "from iteration", firstIteration)
+            lastSaved[cell] = firstIteration
+
+            # Batched AIs run the whole cell as a single batch.
+            chunkSize = CHUNK_SIZE
+            if getEngine(aiIndex) == 'batch':
+                chunkSize = NUM_ITERATIONS
+            for start in range(firstIteration, NUM_ITERATIONS, chunkSize):
+                iterations = range(start, min(start + chunkSize, NUM_ITERATIONS))
+                tasks.append((envIndex, aiIndex, iterations))
+
+    if COMMON_RANDOM_NUMBERS:
+        # Run the AIs of an environment chunk by chunk, side by side, so the
+        # trajectories of a chunk can be paired up and dropped soon.
+        tasks.sort(key=lambda task: (task[0], task[2].start, task[1]))
+    chunkTasks = {}
+    for (envIndex, aiIndex, iterations) in tasks:
+        chunkTasks[(envIndex, iterations)] = chunkTasks.get((envIndex, iterations), 0) + 1
+
+    if numWorkers == 1:
+        chunkResults = map(_runTask, tasks)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=numWorkers, initializer=_initWorker,
+                                       initargs=(experiment, trueFunctionCache.CACHE_DIRECTORY, _workerSettings()))
+        chunkResults = executor.map(_runTask, tasks)
+
+    # Chunks come back in task order, so they are always merged in the same order.
+    failedCells = set()
+    try:
+        for (envIndex, aiIndex, iterations), (trackers, timer, profilePath, trajectories) in zip(tasks, chunkResults):
+            (envName, humanName, tlimit) = _cellNames(envIndex)
+            aiName = aiNames[aiIndex]
+            cell = (envIndex, aiIndex)
+            if timer is not None:
+                if cell not in cellProfiles:
+                    cellProfiles[cell] = (timer, [iterations])
+                else:
+                    cellProfiles[cell][0].merge(timer)
+                    cellProfiles[cell][1].append(iterations)
+            if profilePath is not None:
+                profilePaths.append(profilePath)
+            if COMMON_RANDOM_NUMBERS:
+                chunk = pairChunks.setdefault((envIndex, iterations), {})
+                chunk[aiIndex] = trajectories
+                if len(chunk) == chunkTasks[(envIndex, iterations)]:
+                    _pairChunk(envIndex, pairChunks.pop((envIndex, iterations)), pairTrackers)
+            if trackers is None:
+                failedCells.add(cell)
+            elif cell not in failedCells:
+                if cell not in cellResults:
+                    cellResults[cell] = trackers
+                else:
+                    cellResults[cell].merge(trackers)
+            percentComplete = 100 * iterations.stop/NUM_ITERATIONS
+            print("Human: ", humanName, "AI: ", aiName, "loading: ", percentComplete, "%")
+
+            if iterations.stop < NUM_ITERATIONS:
+                if checkpoints is not None and checkpointEvery is not None and \
+                   cell not in failedCells and iterations.stop - lastSaved[cell] >= checkpointEvery:
+                    checkpoints.savePartial(envSpecs[envIndex], aiName, iterations.stop, cellResults[cell])
+                    lastSaved[cell] = iterations.stop
+                continue
+
+            if cell in failedCells: # due to unimplemented learner
                 print ("Learner unimplemented, moving to next learner.")
                 continue # With next learner
 
-            keyStr = json.dumps((envName, humanName, aiName))
-            allResults[keyStr] = []
-            for t in trange:
-                allResults[keyStr].append((allLearnerResults[t].getMean(), allLearnerResults[t].getCI()))
+            learnerResults = cellResults.pop(cell)
+            cellOutputs[cell] = list(zip(learnerResults.getMeans().tolist(), learnerResults.getCIs().tolist()))
+            if checkpoints is not None:
+                checkpoints.saveFinished(envSpecs[envIndex], aiName, cellOutputs[cell])
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if len(profilePaths) > 0:
+            _mergeProfiles(profilePaths)
+
+    allResults = {}
+    for envIndex in range(len(envSpecs)):
+        (envName, humanName, tlimit) = _cellNames(envIndex)
+        for aiIndex in range(len(aiNames)):
+            if (envIndex, aiIndex) in cellOutputs:
+                keyStr = json.dumps((envName, humanName, aiNames[aiIndex]))
+                allResults[keyStr] = cellOutputs[(envIndex, aiIndex)]
+        for aiA in range(len(aiNames)):
+            for aiB in range(aiA + 1, len(aiNames)):
+                differences = pairTrackers.get((envIndex, aiA, aiB))
+                # Pairs missing some iterations (e.g. cells finished by an earlier run) are left out.
+                if differences is not None and differences.count[0] == NUM_ITERATIONS:
+                    keyStr = json.dumps((envName, humanName, getPairName(aiNames[aiA], aiNames[aiB])))
+                    pairedResults[keyStr] = list(zip(differences.getMeans().tolist(), differences.getCIs().tolist()))
+    return allResults
+
+# Paired differences of the last runGrid with COMMON_RANDOM_NUMBERS, in the
+# same format as its results: for each environment and pair of AIs A and B,
+# the [(mean, ci), ...] of A's cumulative regret minus B's, where both ran
+# the same iterations on the same samples.  Keyed on
+# json.dumps((envName, humanName, getPairName(aiA, aiB))).
+pairedResults = {}
+
+def getPairName(aiNameA, aiNameB):
+    return aiNameA + " - " + aiNameB
+
+# Adds the differences between the trajectories of every pair of AIs in a
+# chunk ({aiIndex: trajectories}, None for failed cells) to pairTrackers.
+def _pairChunk(envIndex, chunk, pairTrackers):
+    for aiA in sorted(chunk):
+        for aiB in sorted(chunk):
+            if aiA >= aiB or chunk[aiA] is None or chunk[aiB] is None:
+                continue
+            if (envIndex, aiA, aiB) not in pairTrackers:
+                pairTrackers[(envIndex, aiA, aiB)] = stat.StatsTrackerArray(chunk[aiA].shape[1])
+            for (trajectoryA, trajectoryB) in zip(chunk[aiA], chunk[aiB]):
+                pairTrackers[(envIndex, aiA, aiB)].update(trajectoryA - trajectoryB)
+
+
+# Per-cell (PhaseTimer, [iterations of each chunk]) of the last runGrid, with PROFILE.
+cellProfiles = {}
+
+# Combines the cProfile stats of every chunk of CPROFILE_CELL into one file.
+def _mergeProfiles(profilePaths):
+    stats = pstats.Stats(profilePaths[0])
+    for path in profilePaths[1:]:
+        stats.add(path)
+    name = re.sub(r'[^A-Za-z0-9_.-]', '-', '_'.join(CPROFILE_CELL))
+    stats.dump_stats(os.path.join(PROFILE_DIRECTORY, name + '.prof'))
+    with open(os.path.join(PROFILE_DIRECTORY, name + '.prof.txt'), 'w') as f:
+        stats.stream = f
+        stats.sort_stats('cumulative').print_stats(50)
+    for path in profilePaths:
+        os.remove(path)
+
+def writeProfileReport(path):
+    """
+    Writes the timers of the last runGrid as JSON: for every cell, the
+    loop that ran it and, for each phase of that loop, its calls, total
+    ns, ns per call, share of the total and (with PROFILE_MEMORY) the
+    peak bytes allocated during a single call.
+    """
+    cells = []
+    for envIndex in range(len(envSpecs)):
+        (envName, humanName, tlimit) = _cellNames(envIndex)
+        for aiIndex in range(len(aiNames)):
+            if (envIndex, aiIndex) not in cellProfiles:
+                continue
+            (timer, chunks) = cellProfiles[(envIndex, aiIndex)]
+            phases = timer.toDict()
+            cells.append({'env': envName, 'human': humanName, 'ai': aiNames[aiIndex],
+                          'engine': getEngine(aiIndex), 'iterations': sum([len(c) for c in chunks]),
+                          'timesteps': getNumTimesteps(tlimit),
+                          'totalNs': sum([p['totalNs'] for p in phases.values()]), 'phases': phases})
+    checkpoint.atomicWriteJson(path, {'settings': checkpointSettings(), 'profileMemory': PROFILE_MEMORY,
+                                      'cells': cells})
+
+
+# Settings that must match for a checkpoint to be resumed.
+def checkpointSettings():
+    settings = {'baseSeed': BASE_SEED, 'numIterations': NUM_ITERATIONS, 'chunkSize': CHUNK_SIZE,
+                'askPeriod': ASK_PERIOD, 'evalImmediately': EVAL_IMMEDIATELY, 'batchMode': BATCH_MODE,
+                'horizon': experiment['horizon']}
+    # Only recorded when used, so checkpoints of earlier runs stay valid.
+    if SLOTS > 1:
+        settings['slots'] = SLOTS
+    if COMMON_RANDOM_NUMBERS:
+        settings['commonRandomNumbers'] = True
+    return settings
+
+
+# argparse type for options that must be at least 1.
+def _positiveInt(value):
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected an integer, got '" + value + "'")
+    if number < 1:
+        raise argparse.ArgumentTypeError("must be at least 1, got " + value)
+    return number
+
+
+# By default, run the full grid from the paper.
+configure(config.makeExperiment())
 
-    with open("allResults.json", "w") as f:
-        json.dump(allResults, f)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the simulations and writes their results to allResults/. "
+                                     "By default every environment and AI from the paper is run.")
+    parser.add_argument("--config",
+                        help="JSON experiment file; any of the options below override it")
+    parser.add_argument("--envs", nargs="+", metavar="ENV",
+                        help="environments to run, e.g. Economics Psychology")
+    parser.add_argument("--humans", nargs="+", metavar="HUMAN",
+                        help="simulated humans to run, e.g. CriticalPointsHuman")
+    parser.add_argument("--ais", nargs="+", metavar="AI",
+                        help="AIs to run, e.g. TESA-10 Optimal (types: " + ", ".join(config.AI_TYPES) + ")")
+    parser.add_argument("--sweep", action="append", metavar="TYPE=V1,V2,...",
+                        help="add one AI per parameter value, e.g. TESA=0,5,10,20")
+    parser.add_argument("--iterations", type=int, help="runs averaged per cell")
+    parser.add_argument("--horizon", type=int, help="timesteps per run")
+    parser.add_argument("--ask-period", type=int, help="timesteps between calls to the human")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS,
+                        help="number of worker processes (default: one per core)")
+    parser.add_argument("--checkpoint-dir", default="checkpoints",
+                        help="directory for per-cell checkpoints (default: %(default)s)")
+    parser.add_argument("--checkpoint-every", type=int, default=100,
+                        help="save unfinished cells every this many iterations (default: %(default)s)")
+    parser.add_argument("--no-checkpoints", action="store_true",
+                        help="do not write checkpoints")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip cells finished by an earlier run and continue unfinished ones")
+    parser.add_argument("--true-function-cache", metavar="DIR",
+                        help="keep true functions and true keypoints in this directory, for later runs")
+    parser.add_argument("--slots", type=_positiveInt, default=SLOTS,
+                        help="experiments run at once; the AI fills every slot each timestep (default: %(default)s)")
+    parser.add_argument("--profile", action="store_true",
+                        help="time each phase of the simulation loop and write profile.json to the results directory")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="with --profile, also record peak allocations per phase (slow)")
+    parser.add_argument("--cprofile", nargs=3, metavar=("ENV", "HUMAN", "AI"),
+                        help="run this cell under cProfile and save ENV_HUMAN_AI.prof (and .prof.txt) to the results directory")
+    parser.add_argument("--common-random-numbers", action="store_true",
+                        help="give every AI the same samples in each iteration, and also write the paired "
+                        "differences between AIs to RESULTS_DIR/paired")
+    parser.add_argument("--results-dir", default="allResults",
+                        help="directory the results are written to (default: %(default)s)")
+    parser.add_argument("--json", action="store_true",
+                        help="also write the results to allResults.json")
+    args = parser.parse_args()
+    trueFunctionCache.CACHE_DIRECTORY = args.true_function_cache
+    SLOTS = args.slots
+    PROFILE = args.profile or args.profile_memory
+    PROFILE_MEMORY = args.profile_memory
+    CPROFILE_CELL = tuple(args.cprofile) if args.cprofile is not None else None
+    PROFILE_DIRECTORY = args.results_dir
+    COMMON_RANDOM_NUMBERS = args.common_random_numbers
+
+    sweeps = None
+    if args.sweep is not None:
+        sweeps = dict([config.parseSweep(s) for s in args.sweep])
+    experimentFile = None
+    if args.config is not None:
+        experimentFile = config.loadConfig(args.config)
+    configure(config.makeExperiment(experimentFile, envNames=args.envs, humanNames=args.humans,
+                                    aiNames=args.ais, sweeps=sweeps, iterations=args.iterations,
+                                    horizon=args.horizon, askPeriod=args.ask_period))
+
+    checkpoints = None
+    if not args.no_checkpoints:
+        checkpoints = checkpoint.CheckpointStore(args.checkpoint_dir, checkpointSettings())
+    allResults = runGrid(args.workers, checkpoints, args.resume, args.checkpoint_every)
+
+    # Written first, so that graphsFromSave.py sees the results directory is newer.
+    if args.json:
+        with open("allResults.json", "w") as f:
+            json.dump(allResults, f)
+    resultsStore.writeResults(args.results_dir, allResults)
+    if COMMON_RANDOM_NUMBERS:
+        resultsStore.writeResults(os.path.join(args.results_dir, "paired"), pairedResults)
+        for keyStr in pairedResults:
+            (envName, humanName, pairName) = json.loads(keyStr)
+            (meanDifference, ci) = pairedResults[keyStr][-1]
+            print("Paired: ", envName, humanName, pairName, "final regret difference: %.2f +/- %.2f" % (meanDifference, ci))
+    if PROFILE:
+        writeProfileReport(os.path.join(args.results_dir, "profile.json"))
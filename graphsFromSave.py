@@ -1,10 +1,18 @@
 # This script creates and saves visualizations as *.png files
-# using json data generated by simulations from graphs.py.
+# using the results of the simulations from graphs.py (see resultsStore.py).
+#
+# Each figure is rendered in its own worker process, without a display
+# (Agg backend).  Curves are downsampled to --max-points points before
+# plotting; the CI figures printed are computed from the full series.
 
+import argparse
 import matplotlib
+matplotlib.use('Agg')
 from matplotlib import pyplot as plt
-import json
+import numpy
 import os, sys
+import resultsStore
+from concurrent.futures import ProcessPoolExecutor
 
 
 #AI Tuples list (modified)
@@ -66,76 +74,142 @@ envTuples = [
             ]
 
 
-if __name__ == "__main__":
-    
+# Returns the indexes of the numPoints points of (x, y) kept by the
+# Largest-Triangle-Three-Buckets algorithm, which keeps the visual shape of the curve.
+# https://skemman.is/bitstream/1946/15343/3/SS_MSthesis.pdf
+def lttbIndexes(x, y, numPoints):
+    if numPoints >= len(x) or numPoints < 3:
+        return numpy.arange(len(x))
+    x = numpy.asarray(x, dtype=float)
+    y = numpy.asarray(y, dtype=float)
+    # The first and last points are always kept, the others are split into numPoints-2 buckets.
+    edges = numpy.linspace(1, len(x) - 1, numPoints - 1).astype(int)
+    indexes = numpy.empty(numPoints, dtype=int)
+    indexes[0] = 0
+    indexes[-1] = len(x) - 1
+    a = 0
+    for i in range(numPoints - 2):
+        (start, end) = (edges[i], edges[i+1])
+        # Average of the next bucket (the last point for the last bucket).
+        nextEnd = edges[i+2] if i + 2 < len(edges) else len(x)
+        nextStart = end if i + 2 < len(edges) else len(x) - 1
+        avgX = x[nextStart:nextEnd].mean()
+        avgY = y[nextStart:nextEnd].mean()
+        areas = numpy.abs((x[a] - avgX) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avgY - y[a]))
+        a = start + int(numpy.argmax(areas))
+        indexes[i+1] = a
+    return indexes
+
+# Returns the indexes of the lowest and highest point in each of numPoints/2
+# equal slices of y, in order, so the envelope of the curve is kept.
+def minMaxIndexes(y, numPoints):
+    if numPoints >= len(y) or numPoints < 2:
+        return numpy.arange(len(y))
+    edges = numpy.linspace(0, len(y), numPoints // 2 + 1).astype(int)
+    indexes = []
+    for (start, end) in zip(edges[:-1], edges[1:]):
+        if end > start:
+            pair = (start + int(numpy.argmin(y[start:end])), start + int(numpy.argmax(y[start:end])))
+            indexes.extend(sorted(set(pair)))
+    return numpy.array(indexes)
+
+# Returns the indexes of the points of the curve to plot.
+def downsample(x, y, maxPoints, method):
+    if method == 'none' or maxPoints is None or maxPoints <= 0:
+        return numpy.arange(len(x))
+    if method == 'minmax':
+        return minMaxIndexes(y, maxPoints)
+    return lttbIndexes(x, y, maxPoints)
+
+
+def renderFigure(envTuple, resultsDirectory, maxPoints, method):
+    """
+    Plots the cumulative regret of every AI of aiTuples on one environment
+    and saves it as a PDF.  Returns the text to print about it.
+    """
     matplotlib.rcParams['ps.useafm'] = True
     matplotlib.rcParams['pdf.use14corefonts'] = True
     #Used in the paper version but requires latex dependencies
     #matplotlib.rcParams['text.usetex'] = True
     matplotlib.rcParams.update({'font.size': 13})
-    humanTuples = []
-    evalTuples = []
-    results = []
-    env_num=0
-    ai_num =0
-    with open("allResults.json", "r") as f:
-        allResults = json.load(f)
-
-
-    ################### ENV LOOP START ################################################################################
-    for env, envName, human, humanName, tlimit in envTuples:
-        env_num+=1
-        trange = range(tlimit)
-
-        linestyleList=['p','<','D','x','*','o','v']
-        i=0
-        changeSpace=0
-        ################################## AI LOOP START ########################################################
-        for ai,aiName in aiTuples:
-            ai_num+=1
-            print("Human: ", humanName, "\nAI: ", aiName)
-            
-            keyStr = json.dumps((envName, humanName, aiName))
-            avgResults = []
-                
-            maxCI = None
-            for t in trange:
-                (mean, ci) = allResults[keyStr][t]
-                if maxCI is None or ci > maxCI:
-                    maxCI = ci
-                avgResults.append(mean)
-
-            height=5000 #height of graph    
-            if 'TESA' in aiName:
-                print("MaxCI:", maxCI)
-                print('Max%', maxCI/height)
-
-            if aiName=='TESA-10': # change the brightness
-                alpha=1.0
-            elif aiName=='Optimal': # remove Optimal graphs
-                continue
-            else:
-                alpha=0.6
-                
-            space=0.5 + changeSpace # change space between markers
-            aiName = aiName.replace("_","-")
-            plt.plot(trange, avgResults, label= aiName, markevery=space, markersize=10, marker=linestyleList[i], alpha=alpha)
-            i+=1
-            changeSpace+=0.03
-        print()
-        
-
-        
-
-
-        ################## CREATE AND SAVE PLOT ##################
-        #Format and write out the plot
-        plt.legend(loc='best')
-        plt.xlabel("Timestep")
-        plt.ylabel("Cumulative Regret") 
-        plt.ylim([-100, height])
-        plt.savefig(envName.replace("Mental Health", "MentalHealth") + "_" + humanName + ".pdf")
-        plt.clf()
-        plt.cla()
-        plt.close()
+    allResults = resultsStore.ResultsReader(resultsDirectory)
+    output = []
+
+    env, envName, human, humanName, tlimit = envTuple
+    trange = numpy.arange(tlimit)
+
+    linestyleList=['p','<','D','x','*','o','v']
+    i=0
+    changeSpace=0
+    ################################## AI LOOP START ########################################################
+    for ai,aiName in aiTuples:
+        output.append("Human:  " + humanName + " \nAI:  " + aiName)
+
+        (means, cis) = allResults.getSeries(envName, humanName, aiName)
+        avgResults = means[:tlimit]
+        maxCI = cis[:tlimit].max()
+
+        height=5000 #height of graph
+        if 'TESA' in aiName:
+            output.append("MaxCI: " + str(maxCI))
+            output.append("Max% " + str(maxCI/height))
+
+        if aiName=='TESA-10': # change the brightness
+            alpha=1.0
+        elif aiName=='Optimal': # remove Optimal graphs
+            continue
+        else:
+            alpha=0.6
+
+        space=0.5 + changeSpace # change space between markers
+        aiName = aiName.replace("_","-")
+        kept = downsample(trange, avgResults, maxPoints, method)
+        plt.plot(trange[kept], avgResults[kept], label= aiName, markevery=space, markersize=10, marker=linestyleList[i], alpha=alpha)
+        i+=1
+        changeSpace+=0.03
+    output.append("")
+
+    ################## CREATE AND SAVE PLOT ##################
+    #Format and write out the plot
+    plt.legend(loc='best')
+    plt.xlabel("Timestep")
+    plt.ylabel("Cumulative Regret")
+    plt.ylim([-100, height])
+    plt.savefig(envName.replace("Mental Health", "MentalHealth") + "_" + humanName + ".pdf")
+    plt.clf()
+    plt.cla()
+    plt.close()
+    return "\n".join(output)
+
+def _renderTask(task):
+    return renderFigure(*task)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Saves the graphs of the results of graphs.py as PDF files.")
+    parser.add_argument("--results-dir", default="allResults",
+                        help="directory of the results (default: %(default)s)")
+    parser.add_argument("--max-points", type=int, default=2000,
+                        help="points plotted per curve, 0 for all of them (default: %(default)s)")
+    parser.add_argument("--downsample", choices=["lttb", "minmax", "none"], default="lttb",
+                        help="how curves are downsampled to --max-points (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="number of figures rendered at once (default: one per core)")
+    args = parser.parse_args()
+
+    # Results saved as allResults.json (by older versions, or with graphs.py --json)
+    # are converted first, unless the results directory is newer.
+    if os.path.exists("allResults.json") and (not resultsStore.exists(args.results_dir) or
+            os.path.getmtime("allResults.json") > resultsStore.modifiedTime(args.results_dir)):
+        print("Converting allResults.json to", args.results_dir)
+        resultsStore.convertJson("allResults.json", args.results_dir)
 
+    tasks = [(envTuple, args.results_dir, args.max_points, args.downsample) for envTuple in envTuples]
+    if args.workers == 1:
+        outputs = map(_renderTask, tasks)
+        for output in outputs:
+            print(output)
+    else:
+        with ProcessPoolExecutor(max_workers=min(args.workers, len(tasks))) as executor:
+            for output in executor.map(_renderTask, tasks):
+                print(output)
@@ -1,8 +1,11 @@
+import hashlib
 import random
 import math
+import numpy
 import environments as envs
 import distributions as dists
 import json
+import logging
 
 # Interface (abstract) for humanSampler objects.
 class humanSampler(object):
@@ -21,6 +24,29 @@ class humanSampler(object):
     def getUpdatedKeypoints(self, lofunc, hifunc):
         pass
 
+    # Same as getUpdatedKeypoints, computed on whole arrays at once.
+    # lofunc and hifunc are numpy arrays of the y values at each x in
+    # getXRange() (dictionaries and visualizers.FunctionViews work too).
+    # Returns the same keypoints as getUpdatedKeypoints.
+    def getUpdatedKeypointsArray(self, lofunc, hifunc):
+        return self.getUpdatedKeypoints(lofunc, hifunc)
+
+    # Turns a function (x maps to y) into a numpy array indexed like getXRange().
+    def toArray(self, func):
+        if isinstance(func, numpy.ndarray):
+            return func
+        if hasattr(func, 'array'):
+            return func.array
+        return numpy.array([func[x] for x in self.env.getXRange()], dtype=float)
+
+    # The keypoints [(x,y),(x,y),...] at the positions where isKeypoint is True,
+    # with y midway between lowFunc and highFunc.
+    def keypointsFromMask(self, isKeypoint, lowFunc, highFunc):
+        positions = numpy.flatnonzero(isKeypoint)
+        xValues = numpy.asarray(self.env.getXRange())[positions].tolist()
+        yValues = ((lowFunc[positions] + highFunc[positions])/2).tolist()
+        return list(zip(xValues, yValues))
+
     #Re-initializes the human sampler from scratch
     #Returns True if reset successful, False otherwise
     def tagOut(self):
@@ -28,6 +54,12 @@ class humanSampler(object):
     
     def buildTheoryFromInitialData(samples):
         pass
+
+    # Returns a value (made of tuples, strings and numbers) such that humans
+    # with the same key place the same keypoints on the same functions.
+    # None means the human cannot be cached.  See trueFunctionCache.
+    def getCacheKey(self):
+        return None
     
 
 # Implements a dummy human that will select keypoints at critical points in the function.
@@ -44,6 +76,9 @@ class CriticalPointsHuman(humanSampler):
         self.env = env
         return True
 
+    def getCacheKey(self):
+        return ('CriticalPointsHuman', self.tolerance, self.tolerDiff)
+
     def getUpdatedKeypoints(self, lowFunc, highFunc):
         
         keypointList = [] #Initialize an empty list.
@@ -56,6 +91,29 @@ class CriticalPointsHuman(humanSampler):
 
         return keypointList
 
+    def getUpdatedKeypointsArray(self, lowFunc, highFunc):
+        lowFunc = self.toArray(lowFunc)
+        highFunc = self.toArray(highFunc)
+        if len(lowFunc) < 3:
+            return []
+        funcRange = self.env.getMaxSample() - self.env.getMinSample()
+        minimum   = self.env.getMinSample()
+
+        # Same tests as isKeypoint, for every x with one on each side:
+        # [:-2] holds the left neighbours, [1:-1] the x values, [2:] the right ones.
+        diff = (highFunc - lowFunc) / funcRange
+        confident = ~(diff > self.tolerance)
+        confident = confident[:-2] & confident[1:-1] & confident[2:]
+
+        scaled = ((highFunc + lowFunc)/2 - minimum) / funcRange
+        (leftScaled, midScaled, rightScaled) = (scaled[:-2], scaled[1:-1], scaled[2:])
+        localMax = (midScaled >= leftScaled + self.tolerDiff) & (midScaled >= rightScaled + self.tolerDiff)
+        localMin = (midScaled <= leftScaled - self.tolerDiff) & (midScaled <= rightScaled - self.tolerDiff)
+
+        isKeypoint = numpy.zeros(len(lowFunc), dtype=bool)
+        isKeypoint[1:-1] = confident & (localMax | localMin)
+        return self.keypointsFromMask(isKeypoint, lowFunc, highFunc)
+
     #Helper function to check if x is a keypoint
     # Keypoints here mean sufficiently confident and overlapping the target value
     def isKeypoint(self, x, highFunc, lowFunc):
@@ -101,48 +159,65 @@ class CriticalPointsHuman(humanSampler):
         return EmpTheoryGetter(self.env, samples)
 
 
+logger = logging.getLogger(__name__)
+
+# A theory function (x maps to y) that also holds its y values as a numpy
+# array indexed like getXRange(), like visualizers.FunctionView.
+class TheoryFunction(dict):
+    def __init__(self, xValues, yValues):
+        dict.__init__(self, zip(xValues, yValues.tolist()))
+        self.array = yValues
+        self.array.flags.writeable = False
+
+# Theories built by EmpTheoryGetter, keyed on (x values, initial samples).
+_empTheories = {}
+MAX_CACHED_THEORIES = 64
+
+# Linear interpolation of the mean initial sample at each sampled x, flat
+# beyond the first and last sampled x.  Theories are shared between calls
+# with the same x values and samples: do not modify them.
 def EmpTheoryGetter(environment, samples):
+    xRange = environment.getXRange()
+    key = (tuple(xRange), tuple(samples))
+    if key in _empTheories:
+        return _empTheories[key]
+
     samplesDict = {}
     for x,y in samples:
         if x not in samplesDict:
             samplesDict[x] = []
         samplesDict[x].append(y)
-        
+
     avgDict = {}
     for x in samplesDict:
         avgDict[x] = sum(samplesDict[x])/len(samplesDict[x])
+    if len(avgDict) == 0:
+        logger.error("EmpTheoryGetter: no initial samples to build a theory from")
+        return TheoryFunction([], numpy.zeros(0))
+
+    #Linearlly interpolate between the sampled x values on each side of x.
+    realXs = numpy.array(sorted(avgDict))
+    realYs = numpy.array([avgDict[x] for x in realXs.tolist()])
+    xs = numpy.asarray(xRange)
+    last = numpy.searchsorted(realXs, xs, side='right') - 1
+    # Before the first sampled x, use the first one; after the last, the last one.
+    inside = (last >= 0) & (last < len(realXs) - 1)
+    last = numpy.clip(last, 0, len(realXs) - 1)
+    following = numpy.minimum(last + 1, len(realXs) - 1)
+    ydiff = realYs[following] - realYs[last]
+    gap = numpy.where(inside, realXs[following] - realXs[last], 1)
+    pos = xs - realXs[last]
+    interpolated = ((pos/gap) * ydiff) + realYs[last]
+    beforeFirst = xs < realXs[0]
+    values = numpy.where(inside & (pos > 0), interpolated, numpy.where(beforeFirst, realYs[0], realYs[last]))
+
+    theory = TheoryFunction(xRange, values)
+    logger.debug("EmpTheoryGetter: sample means %s, theory %s", avgDict, theory)
+    if len(_empTheories) >= MAX_CACHED_THEORIES:
+        _empTheories.clear()
+    _empTheories[key] = theory
+    return theory
 
-    finalDict = {}
-    lastRealX = None
-    #Linearlly interpolate
-    for x in environment.getXRange():
-        if x in avgDict:
-            finalDict[x] = avgDict[x]
-            lastRealX = x
-        nextRealX = None
-        for end in range(x+1, environment.getXRange()[-1]+1):
-            if end in avgDict:
-                nextRealX = end
-                break
-        if lastRealX is None and nextRealX is None:
-            print("should not be possible!")
-        elif lastRealX is None:
-            #At beginning
-            finalDict[x] = avgDict[nextRealX]
-        elif nextRealX is None:
-            # At end
-            finalDict[x] = avgDict[lastRealX]
-        else:
-            ydiff = avgDict[nextRealX] - avgDict[lastRealX]
-            gap = nextRealX-lastRealX
-            pos = x - lastRealX
-            newV = ((pos/gap) * ydiff) + avgDict[lastRealX]
-            finalDict[x] = newV
-    print(avgDict)
-    print(finalDict)
-    return finalDict
-            
-            
 
 # Implements a dummy human that will select keypoints in locations
 # that are "scientifically surprising", meaning that they are
@@ -169,6 +244,13 @@ class DifferenceBasedHuman(humanSampler):
 
         return keypointList
 
+    def getUpdatedKeypointsArray(self, lowFunc, highFunc):
+        lowFunc = self.toArray(lowFunc)
+        highFunc = self.toArray(highFunc)
+        isKeypoint = (highFunc <= self.theoryArray - self.distanceThresh) | \
+                     (lowFunc >= self.theoryArray + self.distanceThresh)
+        return self.keypointsFromMask(isKeypoint, lowFunc, highFunc)
+
     #Helper function to check if x is a keypoint
     # Keypoints here mean sufficiently confident and overlapping the target value
     def isKeypoint(self, x, highFunc, lowFunc):
@@ -183,8 +265,13 @@ class DifferenceBasedHuman(humanSampler):
 
     def buildTheoryFromInitialSamples(self, samples):
         self.theoryFunc = self.theoryFuncGetter(self.env, samples)
+        self.theoryArray = self.toArray(self.theoryFunc)
         return self.theoryFunc
 
+    def getCacheKey(self):
+        return ('DifferenceBasedHuman', self.theoryFuncGetter.__name__, self.distanceThresh,
+                hashlib.sha1(self.theoryArray.tobytes()).hexdigest())
+
 
 # Implements a dummy human that will select keypoints in locations
 # where the function intersects a horizontal line at a specific y-value.
@@ -206,6 +293,9 @@ class SimilarPointsHuman(humanSampler):
         self.targetHiY = self.env.getMinSample() + self.targetHiYP * (self.env.getMaxSample() - self.env.getMinSample())
         return True
 
+    def getCacheKey(self):
+        return ('SimilarPointsHuman', self.targetLoYP, self.targetHiYP, self.tolerance)
+
     def getUpdatedKeypoints(self, lowFunc, highFunc):
         keypointList = [] #Initialize an empty list.
         for x in self.env.getXRange():
@@ -216,6 +306,18 @@ class SimilarPointsHuman(humanSampler):
 
         return keypointList
 
+    def getUpdatedKeypointsArray(self, lowFunc, highFunc):
+        lowFunc = self.toArray(lowFunc)
+        highFunc = self.toArray(highFunc)
+        funcRange = self.env.getMaxSample() - self.env.getMinSample()
+        minimum   = self.env.getMinSample()
+        hiScaled  = ( highFunc - minimum ) / funcRange
+        loScaled  = ( lowFunc - minimum ) / funcRange
+        midY      = ( highFunc + lowFunc ) / 2
+        isKeypoint = (hiScaled - loScaled < self.tolerance) & \
+                     (self.targetHiY >= midY) & (midY >= self.targetLoY)
+        return self.keypointsFromMask(isKeypoint, lowFunc, highFunc)
+
     # Helper function to check if x is a keypoint.
     # Keypoints here mean sufficiently confident and 
     # overlapping the target value.
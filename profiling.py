@@ -0,0 +1,107 @@
+# Opt-in instrumentation of the simulation loop (see graphs.py --profile).
+#
+# A PhaseTimer attributes the time between two calls of mark() to the phase
+# named by the second call, e.g.
+#     timer.start()
+#     x = ai.chooseXValue()
+#     timer.mark('ai.chooseXValue')
+# so the loop only reads the monotonic clock once per phase.  With memory on,
+# it also records the largest amount of memory (as traced by tracemalloc)
+# allocated during each phase; tracemalloc slows everything down, so this is
+# off by default.  When profiling is off the loop is given NULL_TIMER, whose
+# methods do nothing.
+#
+# Timers are merged per (env, human, ai) cell and written as a JSON report.
+
+import time
+import tracemalloc
+
+
+# Makes the peak of tracemalloc.get_traced_memory() restart from the memory traced now.
+def resetPeak():
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+    else:
+        # Python 3.7 and 3.8 have no reset_peak.  Forgetting the traces also
+        # resets the peak; memory freed afterwards that was allocated before
+        # is then not subtracted, so the peaks are only an upper bound.
+        tracemalloc.clear_traces()
+
+
+class PhaseTimer(object):
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.calls = {}
+        self.totalNs = {}
+        self.peakBytes = {}
+        self.last = None
+
+    # Starts timing the next phase (and, with memory, tracing allocations).
+    def start(self):
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            resetPeak()
+            self.traced = tracemalloc.get_traced_memory()[0]
+        self.last = time.perf_counter_ns()
+
+    # Ends the phase started by the previous start() or mark() and starts the next one.
+    def mark(self, phase):
+        now = time.perf_counter_ns()
+        if phase in self.calls:
+            self.calls[phase] += 1
+            self.totalNs[phase] += now - self.last
+        else:
+            self.calls[phase] = 1
+            self.totalNs[phase] = now - self.last
+        if self.memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            self.peakBytes[phase] = max(self.peakBytes.get(phase, 0), peak - self.traced)
+            resetPeak()
+            self.traced = tracemalloc.get_traced_memory()[0]
+        self.last = time.perf_counter_ns()
+
+    # Stops tracing allocations.
+    def stop(self):
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    # Adds the counters of another PhaseTimer (e.g. from another chunk of iterations).
+    def merge(self, other):
+        for phase in other.calls:
+            self.calls[phase] = self.calls.get(phase, 0) + other.calls[phase]
+            self.totalNs[phase] = self.totalNs.get(phase, 0) + other.totalNs[phase]
+        for phase in other.peakBytes:
+            self.peakBytes[phase] = max(self.peakBytes.get(phase, 0), other.peakBytes[phase])
+
+    # Returns {phase: {'calls', 'totalNs', 'nsPerCall', 'share'[, 'peakBytes']}}.
+    def toDict(self):
+        total = sum(self.totalNs.values())
+        phases = {}
+        for phase in sorted(self.calls, key=lambda p: -self.totalNs[p]):
+            phases[phase] = {'calls': self.calls[phase], 'totalNs': self.totalNs[phase],
+                             'nsPerCall': self.totalNs[phase] / self.calls[phase],
+                             'share': self.totalNs[phase] / total if total > 0 else 0.0}
+            if phase in self.peakBytes:
+                phases[phase]['peakBytes'] = self.peakBytes[phase]
+        return phases
+
+    # Picklable, so that worker processes can send timers back; the clock state is not kept.
+    def __getstate__(self):
+        return {'memory': self.memory, 'calls': self.calls, 'totalNs': self.totalNs,
+                'peakBytes': self.peakBytes, 'last': None}
+
+
+class NullTimer(object):
+
+    def start(self):
+        pass
+
+    def mark(self, phase):
+        pass
+
+    def stop(self):
+        pass
+
+NULL_TIMER = NullTimer()
@@ -0,0 +1,155 @@
+# Columnar binary storage for the results of graphs.py.
+#
+# A results directory holds two float64 .npy columns, of means and of CIs,
+# with the series of every (env, human, ai) cell stored one after the other,
+# and manifest.json, which names the columns and lists the cells with the
+# offset and length of their series in them.  ResultsReader memory-maps the
+# columns, so only the series that are actually read are loaded from disk.
+#
+# Every write gives its columns new names (means.<token>.npy), so replacing
+# manifest.json switches readers from one complete run to the next, and a
+# write that is interrupted leaves the previous results intact.
+#
+# Each series is the [(mean, ci), ...] list of one cell of allResults (see
+# graphs.runGrid), stored without any loss of precision.
+#
+# Usage, to convert an allResults.json file written by an older version:
+#   python resultsStore.py allResults.json allResults
+
+import json
+import os
+import sys
+import uuid
+import numpy
+import checkpoint
+
+MANIFEST_VERSION = 2
+
+# Names of the columns of version 1 manifests, which did not record them.
+V1_COLUMNS = {'means': 'means.npy', 'cis': 'cis.npy'}
+
+def _manifestPath(directory):
+    return os.path.join(directory, 'manifest.json')
+
+# Saves array as directory/name with numpy.save, replacing any existing file in a single step.
+def _atomicSave(directory, name, array):
+    path = os.path.join(directory, name)
+    tmpPath = path + '.' + str(os.getpid()) + '.tmp'
+    with open(tmpPath, 'wb') as f:
+        numpy.save(f, array)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmpPath, path)
+
+
+def writeResults(directory, allResults):
+    """
+    Writes allResults, the dictionary returned by graphs.runGrid (keyed on
+    json.dumps((envName, humanName, aiName))), to the results directory.
+    The columns are written under new names and the manifest is replaced
+    last, so readers see either the old results or the new ones, never a
+    mix.  The columns of the old results are deleted afterwards.
+    """
+    os.makedirs(directory, exist_ok=True)
+    cells = []
+    offset = 0
+    for (keyStr, series) in allResults.items():
+        (envName, humanName, aiName) = json.loads(keyStr)
+        cells.append({'env': envName, 'human': humanName, 'ai': aiName,
+                      'offset': offset, 'length': len(series)})
+        offset += len(series)
+
+    means = numpy.empty(offset)
+    cis = numpy.empty(offset)
+    for (cell, series) in zip(cells, allResults.values()):
+        if len(series) > 0:
+            (means[cell['offset']:cell['offset']+cell['length']],
+             cis[cell['offset']:cell['offset']+cell['length']]) = zip(*series)
+
+    token = uuid.uuid4().hex
+    columns = {'means': 'means.' + token + '.npy', 'cis': 'cis.' + token + '.npy'}
+    _atomicSave(directory, columns['means'], means)
+    _atomicSave(directory, columns['cis'], cis)
+    oldColumns = _readColumns(directory)
+    checkpoint.atomicWriteJson(_manifestPath(directory), {'version': MANIFEST_VERSION, 'columns': columns,
+                                                          'cells': cells})
+    for name in oldColumns:
+        path = os.path.join(directory, name)
+        if name not in columns.values() and os.path.exists(path):
+            os.remove(path)
+
+# Returns the file names of the columns the current manifest points at, or [] if there is none.
+def _readColumns(directory):
+    if not exists(directory):
+        return []
+    with open(_manifestPath(directory), 'r') as f:
+        manifest = json.load(f)
+    return list(manifest.get('columns', V1_COLUMNS).values())
+
+# Returns True if directory holds results written by writeResults.
+def exists(directory):
+    return os.path.exists(_manifestPath(directory))
+
+# Returns the time (as os.path.getmtime) results were last written to directory.
+def modifiedTime(directory):
+    return os.path.getmtime(_manifestPath(directory))
+
+
+class ResultsReader(object):
+    """
+    Read access to a results directory.  Series are returned as read-only
+    views of the memory-mapped columns.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        with open(_manifestPath(directory), 'r') as f:
+            manifest = json.load(f)
+        if manifest['version'] not in (1, MANIFEST_VERSION):
+            raise ValueError("Unsupported results version " + str(manifest['version']) + " in " + directory)
+        self.cells = {}
+        for cell in manifest['cells']:
+            self.cells[(cell['env'], cell['human'], cell['ai'])] = (cell['offset'], cell['length'])
+        self.columns = manifest.get('columns', V1_COLUMNS)
+        self.means = None
+        self.cis = None
+
+    # (envName, humanName, aiName) of every cell, in the order they were written.
+    def keys(self):
+        return list(self.cells.keys())
+
+    def __contains__(self, key):
+        return tuple(key) in self.cells
+
+    def _columns(self):
+        if self.means is None:
+            self.means = numpy.load(os.path.join(self.directory, self.columns['means']), mmap_mode='r')
+            self.cis = numpy.load(os.path.join(self.directory, self.columns['cis']), mmap_mode='r')
+        return (self.means, self.cis)
+
+    # Returns (means, cis), the arrays of the mean and the CI of every timestep of a cell.
+    def getSeries(self, envName, humanName, aiName):
+        (offset, length) = self.cells[(envName, humanName, aiName)]
+        (means, cis) = self._columns()
+        return (means[offset:offset+length], cis[offset:offset+length])
+
+    # Returns the results as the allResults dictionary written to allResults.json.
+    def toDict(self):
+        allResults = {}
+        for (envName, humanName, aiName) in self.keys():
+            (means, cis) = self.getSeries(envName, humanName, aiName)
+            allResults[json.dumps((envName, humanName, aiName))] = list(zip(means.tolist(), cis.tolist()))
+        return allResults
+
+
+# Converts an allResults.json file to a results directory.
+def convertJson(jsonFName, directory):
+    with open(jsonFName, 'r') as f:
+        allResults = json.load(f)
+    writeResults(directory, allResults)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python resultsStore.py allResults.json RESULTS_DIRECTORY")
+        sys.exit(1)
+    convertJson(sys.argv[1], sys.argv[2])
@@ -0,0 +1,156 @@
+import array
+import bisect
+import numpy
+
+# Compact storage for the samples gathered at each x value.
+#
+# Most code only needs how many samples were taken at an x value and their
+# mean, so rather than one growing list of y values per x we keep a count,
+# a running sum and a running sum of squares per x, in flat arrays.
+# The raw y values are only retained when keepValues is True.
+class SampleStore(object):
+
+    def __init__(self, numXValues, keepValues=False):
+        self.keepValues = keepValues
+        self.counts = array.array('q', [0] * numXValues)
+        self.sums = array.array('d', [0.0] * numXValues)
+        self.sumSquares = array.array('d', [0.0] * numXValues)
+        self.totalCount = 0
+        self.rawValues = None
+        if keepValues:
+            self.rawValues = [[] for x in range(numXValues)]
+
+    # Forgets every sample, keeping the same number of x values.
+    def reset(self):
+        for x in range(len(self.counts)):
+            self.counts[x] = 0
+            self.sums[x] = 0.0
+            self.sumSquares[x] = 0.0
+        self.totalCount = 0
+        if self.keepValues:
+            self.rawValues = [[] for x in range(len(self.counts))]
+
+    # Number of x values
+    def __len__(self):
+        return len(self.counts)
+
+    # Takes in a single xValue(int), and a single yValue(double)
+    def add(self, xValue, yValue):
+        self.counts[xValue] += 1
+        self.sums[xValue] += yValue
+        self.sumSquares[xValue] += yValue * yValue
+        self.totalCount += 1
+        if self.keepValues:
+            self.rawValues[xValue].append(yValue)
+
+    # Removes one sample with value yValue from xValue.
+    def remove(self, xValue, yValue):
+        self.counts[xValue] -= 1
+        self.sums[xValue] -= yValue
+        self.sumSquares[xValue] -= yValue * yValue
+        self.totalCount -= 1
+        if self.keepValues:
+            self.rawValues[xValue].remove(yValue)
+
+    def count(self, xValue):
+        return self.counts[xValue]
+
+    def sum(self, xValue):
+        return self.sums[xValue]
+
+    # Mean of the samples at xValue, None if there are none.
+    def mean(self, xValue):
+        if self.counts[xValue] == 0:
+            return None
+        return self.sums[xValue] / self.counts[xValue]
+
+    # Population variance of the samples at xValue, None if there are none.
+    def variance(self, xValue):
+        count = self.counts[xValue]
+        if count == 0:
+            return None
+        mean = self.sums[xValue] / count
+        return max(self.sumSquares[xValue] / count - mean * mean, 0.0)
+
+    # The y values sampled at xValue, in the order they arrived.
+    # Only available when the store was created with keepValues=True.
+    def values(self, xValue):
+        if not self.keepValues:
+            raise ValueError("SampleStore was created without keepValues")
+        return self.rawValues[xValue]
+
+    # numpy views of the per-x counts and sums.
+    # These share memory with the store, so they stay up to date.
+    def getCountArray(self):
+        return numpy.frombuffer(self.counts, dtype=numpy.int64)
+
+    def getSumArray(self):
+        return numpy.frombuffer(self.sums, dtype=numpy.float64)
+
+
+# Finds the least sampled of a fixed list of x values (e.g. keypoints) in O(1),
+# as the sample counts go up and down one at a time.
+#
+# Ties go to the x value that comes first in xValues, as in
+# utilities.chooseOptimalXValue.  To keep that order, the x values are bucketed
+# by sample count, and each bucket holds the ranks (positions in xValues) of
+# its x values in sorted order.  The least sampled x value is then the first
+# one of the lowest non-empty bucket.
+class LeastSampledTracker(object):
+
+    # Takes in the x values to track, in tie-breaking order, and the current
+    # sample counts (a sequence indexed by x, e.g. SampleStore.counts).
+    def __init__(self, xValues, sampleCounts):
+        self.xValues = list(xValues)
+        self.ranks = {}
+        for rank in range(len(self.xValues)):
+            if self.xValues[rank] not in self.ranks:
+                self.ranks[self.xValues[rank]] = rank
+        self.counts = {}
+        self.buckets = {}
+        for x in self.ranks:
+            count = sampleCounts[x]
+            self.counts[x] = count
+            self.buckets.setdefault(count, []).append(self.ranks[x])
+        for count in self.buckets:
+            self.buckets[count].sort()
+        self.minCount = min(self.buckets) if self.buckets else None
+
+    def __contains__(self, xValue):
+        return xValue in self.ranks
+
+    def __len__(self):
+        return len(self.ranks)
+
+    # The least sampled x value, None if no x values are tracked.
+    def min(self):
+        if self.minCount is None:
+            return None
+        return self.xValues[self.buckets[self.minCount][0]]
+
+    # The number of samples at the least sampled x value.
+    def getMinCount(self):
+        return self.minCount
+
+    # Records one more sample at xValue, which must be tracked.
+    def increment(self, xValue):
+        count = self.counts[xValue]
+        self._move(xValue, count, count + 1)
+        if count == self.minCount and count not in self.buckets:
+            self.minCount = count + 1
+
+    # Records one sample less at xValue, which must be tracked.
+    def decrement(self, xValue):
+        count = self.counts[xValue]
+        self._move(xValue, count, count - 1)
+        if count - 1 < self.minCount:
+            self.minCount = count - 1
+
+    def _move(self, xValue, fromCount, toCount):
+        rank = self.ranks[xValue]
+        bucket = self.buckets[fromCount]
+        del bucket[bisect.bisect_left(bucket, rank)]
+        if len(bucket) == 0:
+            del self.buckets[fromCount]
+        bisect.insort(self.buckets.setdefault(toCount, []), rank)
+        self.counts[xValue] = toCount
@@ -1,29 +1,73 @@
 #https://en.wikipedia.org/wiki/Algorithms_for_calculating_variance#Welford's_online_algorithm
-import math
+import numpy
 
-class StatsTracker:
+class StatsTrackerArray:
+    """
+    Welford's running mean and variance of every timestep of a trajectory,
+    held as three numpy arrays (count, mean and M2).  Each operation gives
+    exactly the same numbers as the scalar algorithm applied to every
+    timestep in turn.
+    """
 
-    def __init__(self):
-        self.existingAggregate = (0,0,0)
+    def __init__(self, length):
+        self.count = numpy.zeros(length, dtype=numpy.int64)
+        self.mean = numpy.zeros(length)
+        self.M2 = numpy.zeros(length)
 
-    def update(self, newValue):
-        (count, mean, M2) = self.existingAggregate
-        count += 1
-        delta = newValue - mean
-        mean += delta / count
-        delta2 = newValue - mean
-        M2 += delta * delta2
+    def __len__(self):
+        return len(self.count)
 
-        self.existingAggregate =  (count, mean, M2)
+    # Adds newValues[t] to the values of every timestep t (Welford's update).
+    def update(self, newValues):
+        self.count += 1
+        delta = newValues - self.mean
+        self.mean += delta / self.count
+        delta2 = newValues - self.mean
+        self.M2 += delta * delta2
 
+    # Adds all of newValues to the values of timestep t, up to rounding the
+    # same as adding them one at a time.
+    def updateBatch(self, t, newValues):
+        batch = StatsTrackerArray(1)
+        mean = numpy.mean(newValues)
+        (batch.count[0], batch.mean[0], batch.M2[0]) = (len(newValues), mean, numpy.sum((newValues - mean)**2))
+        self.merge(batch, t)
 
-    def getMean(self):
-        (count, mean, M2) = self.existingAggregate
-        return mean
+    # Folds the aggregates of another StatsTrackerArray into the timesteps
+    # [start, start + len(other)) of this one.
+    def merge(self, other, start=0):
+        end = start + len(other)
+        countA = self.count[start:end]
+        meanA = self.mean[start:end]
+        M2A = self.M2[start:end]
+        count = countA + other.count
+        delta = other.mean - meanA
+        # Timesteps where either side is empty just keep the other side's aggregate.
+        both = (countA > 0) & (other.count > 0)
+        safeCount = numpy.where(both, count, 1)
+        mean = numpy.where(both, meanA + delta * other.count / safeCount, meanA + other.mean)
+        M2 = numpy.where(both, M2A + other.M2 + delta * delta * countA * other.count / safeCount, M2A + other.M2)
 
-    def getCI(self):
-        (count, mean, M2) = self.existingAggregate
-        variance = M2 / count
-        stddev = math.sqrt(variance)
-        se = stddev / math.sqrt(count)
+        self.count[start:end] = count
+        self.mean[start:end] = mean
+        self.M2[start:end] = M2
+
+    def getMeans(self):
+        return self.mean
+
+    def getCIs(self):
+        variance = self.M2 / self.count
+        stddev = numpy.sqrt(variance)
+        se = stddev / numpy.sqrt(self.count)
         return 1.96*se
+
+    # [(count, mean, M2), ...] for every timestep, e.g. to save as JSON.
+    def getAggregates(self):
+        return list(zip(self.count.tolist(), self.mean.tolist(), self.M2.tolist()))
+
+    @staticmethod
+    def fromAggregates(aggregates):
+        trackers = StatsTrackerArray(len(aggregates))
+        for t in range(len(aggregates)):
+            (trackers.count[t], trackers.mean[t], trackers.M2[t]) = aggregates[t]
+        return trackers
@@ -0,0 +1,48 @@
+# Checks that utilities.EvalScoreState gives the same scores as utilities.getEvalScore.
+#
+# Usage: python -m pytest -q test_evalScoreState.py
+
+import random
+import pytest
+import utilities as util
+
+NUM_X_VALUES = 20
+DELTA = 0.1
+
+
+def randomKeypoints(rng):
+    xes = rng.sample(range(NUM_X_VALUES), rng.randint(0, 6))
+    return [(x, rng.random()) for x in xes]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_matchesGetEvalScore(seed):
+    rng = random.Random(seed)
+    state = util.EvalScoreState(NUM_X_VALUES, DELTA)
+    samples = [[] for x in range(NUM_X_VALUES)]
+    keypoints = []
+    for step in range(500):
+        action = rng.random()
+        if action < 0.6:
+            x = rng.randrange(NUM_X_VALUES)
+            samples[x].append(rng.random())
+            state.addSample(x)
+        elif action < 0.8:
+            sampled = [x for x in range(NUM_X_VALUES) if len(samples[x]) > 0]
+            if len(sampled) > 0:
+                x = rng.choice(sampled)
+                samples[x].pop()
+                state.removeSample(x)
+        elif action < 0.9:
+            keypoints = randomKeypoints(rng)
+            state.setKeypoints(keypoints)
+        else:
+            # The same list object again, as graphs.py passes it every step.
+            state.setKeypoints(keypoints)
+
+        assert state.score() == pytest.approx(util.getEvalScore(samples, keypoints, DELTA), rel=1e-12)
+        for x in range(NUM_X_VALUES):
+            samples[x].append(0.0)
+            expected = util.getEvalScore(samples, keypoints, DELTA)
+            samples[x].pop()
+            assert state.scoreIfAdded(x) == pytest.approx(expected, rel=1e-12)
@@ -0,0 +1,89 @@
+# Memoizes the true function of each environment and the true keypoints
+# a simulated human finds on it.
+#
+# Both only depend on the environment (dataset file or synthetic curve), the
+# human type and parameters, and, for humans that compare against a theory,
+# that theory.  They are computed once per process, keyed on
+# MIEnvironment.getCacheKey() and humanSampler.getCacheKey(); objects without
+# a cache key (None) are never cached.
+#
+# With CACHE_DIRECTORY set, results are also saved there as JSON and reused
+# by later runs.
+#
+# The returned dictionaries and lists are shared: do not modify them.
+
+import hashlib
+import json
+import os
+import checkpoint
+
+# Directory for results persisted across runs, None to only cache in memory.
+CACHE_DIRECTORY = None
+
+_trueFunctions = {}
+_trueKeypoints = {}
+
+def clear():
+    _trueFunctions.clear()
+    _trueKeypoints.clear()
+
+
+def _path(kind, key):
+    digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+    return os.path.join(CACHE_DIRECTORY, kind + '_' + digest + '.json')
+
+# Returns what was saved under key, or None.
+def _load(kind, key):
+    if CACHE_DIRECTORY is None:
+        return None
+    path = _path(kind, key)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        saved = json.load(f)
+    if saved['key'] != repr(key):
+        return None
+    return saved['value']
+
+def _save(kind, key, value):
+    if CACHE_DIRECTORY is None:
+        return
+    os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+    checkpoint.atomicWriteJson(_path(kind, key), {'key': repr(key), 'value': value})
+
+
+# Returns env.generateTrueFunction(), a dictionary mapping x to its true mean y.
+def getTrueFunction(env):
+    key = env.getCacheKey()
+    if key is None:
+        return env.generateTrueFunction()
+    if key not in _trueFunctions:
+        saved = _load('trueFunction', key)
+        if saved is not None:
+            trueFunction = dict(zip(saved['xValues'], saved['yValues']))
+        else:
+            trueFunction = env.generateTrueFunction()
+            _save('trueFunction', key, {'xValues': list(trueFunction.keys()),
+                                        'yValues': list(trueFunction.values())})
+        _trueFunctions[key] = trueFunction
+    return _trueFunctions[key]
+
+# Returns the keypoints human places when shown the true function of env,
+# i.e. human.getUpdatedKeypoints(trueFunction, trueFunction).
+# human must have been initialized with env (and given its theory, if any).
+def getTrueKeypoints(env, human):
+    trueFunction = getTrueFunction(env)
+    envKey = env.getCacheKey()
+    humanKey = human.getCacheKey()
+    if envKey is None or humanKey is None:
+        return human.getUpdatedKeypointsArray(trueFunction, trueFunction)
+    key = (envKey, humanKey)
+    if key not in _trueKeypoints:
+        saved = _load('trueKeypoints', key)
+        if saved is not None:
+            keypoints = [(x, y) for (x, y) in saved]
+        else:
+            keypoints = human.getUpdatedKeypointsArray(trueFunction, trueFunction)
+            _save('trueKeypoints', key, keypoints)
+        _trueKeypoints[key] = keypoints
+    return _trueKeypoints[key]
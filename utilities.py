@@ -2,8 +2,10 @@ import math
 
 #Takes in a sample list and returns the confidence variable over the list of samples.
 def getCI(listofSamples, delta):
-    sampleCount = len(listofSamples)
-    
+    return getCIFromCount(len(listofSamples), delta)
+
+#Same as getCI, but takes the number of samples rather than the samples themselves.
+def getCIFromCount(sampleCount, delta):
     sampleCount += 0.01
     #v = math.sqrt( (math.log(2/delta)) /(2*sampleCount) )
     #print("getCi : ", v, "sample no = ", sampleCount)
@@ -19,16 +21,16 @@ def clampY(env,yVal):
     return yVal
 
 
-def chooseOptimalXValue(keypoints, samples):
+def chooseOptimalXValue(keypoints, sampleCounts):
     """
     This method returns the optimal x value to sample next, given
     an existing set of samples.
     
     Param(s):
-        keypoints:  a list of tuples of x,y coordinate pairs.
-        samples:    a 2D list of y values per x value.
-                    E.g., [ [y,y,y,y,y], [y,y], [y,y,y,y] ]
-                    The indices are the x values.
+        keypoints:      a list of tuples of x,y coordinate pairs.
+        sampleCounts:   the number of samples per x value,
+                        e.g. SampleStore.counts: [5, 2, 4]
+                        The indices are the x values.
     Returns:
         minSampsX:  an int, representing the x coordinate 
                     that has been sampled the least, so far. 
@@ -43,7 +45,7 @@ def chooseOptimalXValue(keypoints, samples):
         # x coordinate at a keypoint.
         x = keypoints[kpIdx][0]
         # The quantity of samples at the keypoint.
-        sampQuant = len(samples[x])
+        sampQuant = sampleCounts[x]
         # Identify the least sampled keypoint.
         if minSamps is None or sampQuant < minSamps:
             minSampsX = x
@@ -99,4 +101,98 @@ def getEvalScore(samples, currentKeypoints, delta):
 
     #score = CISum2 - float(penaltySum)
     return score
-    
+
+
+class EvalScoreState(object):
+    """
+    Keeps the quantities behind getEvalScore up to date as samples and
+    keypoints arrive, so that the score never has to be recomputed from
+    scratch.
+
+    score() matches getEvalScore(samples, keypoints, delta) for the samples
+    passed to addSample and the keypoints passed to setKeypoints.
+    score() and scoreIfAdded(x) are O(1), addSample(x) and removeSample(x)
+    are O(1), and setKeypoints is O(1) when given the same list object again
+    and O(number of keypoints) otherwise.
+    Keypoint x values are assumed to be distinct, as the humans produce them.
+    """
+    def __init__(self, numXValues, delta):
+        self.delta = delta
+        self.counts = [0] * numXValues
+        self.reset()
+
+    # Replaces the sample counts (a sequence indexed by x), keeping the keypoints.
+    def setCounts(self, counts):
+        keypointXes = self.keypointXes
+        self.reset()
+        for x in range(len(self.counts)):
+            self.counts[x] = counts[x]
+            self.totalSamples += counts[x]
+        self.setKeypoints([(x, None) for x in keypointXes])
+
+    # Forgets all samples and keypoints.
+    def reset(self):
+        for x in range(len(self.counts)):
+            self.counts[x] = 0
+        self.keypointXes = set()
+        self.lastKeypointList = None
+        self.totalSamples = 0
+        # Samples at keypoint x values, and the sum of their CIs.
+        self.keypointSamples = 0
+        self.CISum = 0.0
+
+    def addSample(self, xValue):
+        if xValue in self.keypointXes:
+            self.CISum += self._ciChangeIfAdded(xValue)
+            self.keypointSamples += 1
+        self.counts[xValue] += 1
+        self.totalSamples += 1
+
+    def removeSample(self, xValue):
+        self.counts[xValue] -= 1
+        self.totalSamples -= 1
+        if xValue in self.keypointXes:
+            self.CISum -= self._ciChangeIfAdded(xValue)
+            self.keypointSamples -= 1
+
+    # Takes in current keypoints.
+    # Keypoints are a list of tuples: [(x,y),(x,y),(x,y)...]
+    def setKeypoints(self, currentKeypoints):
+        # The evaluators pass the same list object until the keypoints change.
+        if currentKeypoints is self.lastKeypointList:
+            return
+        self.lastKeypointList = currentKeypoints
+        newXes = set([x for (x, y) in currentKeypoints])
+        if newXes == self.keypointXes:
+            return
+        for x in self.keypointXes - newXes:
+            self.CISum -= getCIFromCount(self.counts[x], self.delta)
+            self.keypointSamples -= self.counts[x]
+        for x in newXes - self.keypointXes:
+            self.CISum += getCIFromCount(self.counts[x], self.delta)
+            self.keypointSamples += self.counts[x]
+        self.keypointXes = newXes
+        if len(newXes) == 0:
+            # Drop any accumulated rounding error.
+            self.CISum = 0.0
+
+    def score(self):
+        return self._score(self.CISum, self.totalSamples - self.keypointSamples)
+
+    # The score we would have after one more sample at xValue.
+    def scoreIfAdded(self, xValue):
+        if xValue in self.keypointXes:
+            return self._score(self.CISum + self._ciChangeIfAdded(xValue),
+                               self.totalSamples - self.keypointSamples)
+        return self._score(self.CISum, self.totalSamples - self.keypointSamples + 1)
+
+    def _ciChangeIfAdded(self, xValue):
+        count = self.counts[xValue]
+        return getCIFromCount(count + 1, self.delta) - getCIFromCount(count, self.delta)
+
+    def _score(self, CISum, penaltySum):
+        k = len(self.keypointXes)
+        if k == 0:
+            return 0.0
+        # k is the quantity of keypoints
+        return float(k/CISum) - float(penaltySum)
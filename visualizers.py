@@ -1,8 +1,12 @@
+import array
 import random
 import math
+import numpy
+from collections.abc import Mapping
 import environments as envs
 import distributions as dists
 import utilities as util
+from sampleStore import SampleStore
 
 # Interface (abstract) for vizualizer objects.
 class Visualizer(object):
@@ -25,6 +29,43 @@ class Visualizer(object):
     def generateVisualization(self):
         pass
 
+    # Batched versions of the above, which advance numRuns independent runs at once.
+    # Arrays have one row per run and one column per x value.
+    def initBatch(self, env, numRuns):
+        pass
+
+    # Takes in numpy arrays holding one xValue(int) and one yValue(double) per run.
+    def processSampleBatch(self, xValues, yValues):
+        pass
+
+    # Returns a tuple of arrays (lofunc, func, hifunc), each of shape (numRuns, |X|).
+    def generateVisualizationBatch(self):
+        pass
+
+# A read-only, dict-like function (x maps to y) over an array of y values,
+# one per x in range(len(values)).
+# The numpy array "array" shares memory with it.
+class FunctionView(Mapping):
+
+    def __init__(self, values):
+        self.values = values
+        self.array = numpy.frombuffer(values, dtype=numpy.float64)
+
+    def __getitem__(self, x):
+        if x < 0:
+            raise KeyError(x)
+        try:
+            return self.values[x]
+        except IndexError:
+            raise KeyError(x)
+
+    def __iter__(self):
+        return iter(range(len(self.values)))
+
+    def __len__(self):
+        return len(self.values)
+
+
 class BasicVisualizer(Visualizer):
 
     def __init__(self, delta):
@@ -36,36 +77,83 @@ class BasicVisualizer(Visualizer):
     # Returns True if initialization was successful, False otherwise
     def initWithEnvironment(self, env):
         self.env = env
-        self.samples = [] 
-        for i in self.env.getXRange():
-            self.samples.append([])
+        numXValues = len(self.env.getXRange())
+        self.samples = SampleStore(numXValues)
+        # The visualization is kept up to date one x value at a time:
+        # generateVisualization only recomputes the x values sampled since
+        # it was last called.
+        self.lowValues = array.array('d', [0.0] * numXValues)
+        self.funcValues = array.array('d', [0.0] * numXValues)
+        self.highValues = array.array('d', [0.0] * numXValues)
+        self.views = (FunctionView(self.lowValues), FunctionView(self.funcValues), FunctionView(self.highValues))
+        self.dirtyXValues = set(self.env.getXRange())
         return True
 
     # Processes a sample from environment.
     # Takes in a single xValue(int), and a single yValue(double)
     def processSample(self, xValue, yValue):
-        self.samples[xValue].append(yValue)
+        self.samples.add(xValue, yValue)
+        self.dirtyXValues.add(xValue)
 
     # Returns a tuple of functions(lofunc,func, hifunc)
     # All functions should be dictionaries (x maps to y)
     # "function" is the measured response function.
     # It is guaranteed that lowfunc(x) <= func(x) <= hifunc(x).
     # Returned tuple wil be used for visualizations.
-    def generateVisualization(self):  
-        func = {} #func is just the average
-        lowFunc = {}
-        highFunc = {}
-        for i in self.env.getXRange():
-            if len(self.samples[i]) == 0:
-                func[i] = (self.env.getMaxSample() + self.env.getMinSample())/2 
-            else:
-                func[i] = sum(self.samples[i])/len(self.samples[i])                
-                
-            confIntv = util.getCI(self.samples[i], self.delta)
-            if confIntv is None:
-                confIntv = 1    
-            confIntv *=(self.env.getMaxSample() - self.env.getMinSample())
-                
-            lowFunc[i]=(util.clampY(self.env, func[i] - confIntv))
-            highFunc[i]=(util.clampY(self.env, func[i] + confIntv))
+    #
+    # The functions are FunctionViews, which read like dictionaries.  They are
+    # the same objects on every call, updated in place, so copy them (e.g. with
+    # dict()) to keep the visualization of a given timestep.
+    def generateVisualization(self):
+        for i in self.dirtyXValues:
+            self.updateX(i)
+        self.dirtyXValues.clear()
+        return self.views
+
+    # Recomputes the visualization at x value i.
+    def updateX(self, i):
+        count = self.samples.count(i)
+        if count == 0:
+            func = (self.env.getMaxSample() + self.env.getMinSample())/2
+        else:
+            func = self.samples.sum(i)/count
+
+        confIntv = util.getCIFromCount(count, self.delta)
+        if confIntv is None:
+            confIntv = 1
+        confIntv *=(self.env.getMaxSample() - self.env.getMinSample())
+
+        self.funcValues[i] = func
+        self.lowValues[i] = util.clampY(self.env, func - confIntv)
+        self.highValues[i] = util.clampY(self.env, func + confIntv)
+
+    # Re-initilializes numRuns independent runs with a given MIEnvironment
+    # Returns True if initialization was successful, False otherwise
+    def initBatch(self, env, numRuns):
+        self.env = env
+        self.batchRows = numpy.arange(numRuns)
+        self.batchCounts = numpy.zeros((numRuns, len(self.env.getXRange())), dtype=numpy.int64)
+        self.batchSums = numpy.zeros((numRuns, len(self.env.getXRange())))
+        return True
+
+    # Takes in numpy arrays holding one xValue(int) and one yValue(double) per run.
+    def processSampleBatch(self, xValues, yValues):
+        self.batchCounts[self.batchRows, xValues] += 1
+        self.batchSums[self.batchRows, xValues] += yValues
+
+    # Same as generateVisualization, for every run at once.
+    # Returns a tuple of arrays (lofunc, func, hifunc), each of shape (numRuns, |X|).
+    def generateVisualizationBatch(self):
+        minY = self.env.getMinSample()
+        maxY = self.env.getMaxSample()
+        counts = self.batchCounts
+        sampled = counts > 0
+        func = numpy.full(counts.shape, (maxY + minY)/2)
+        func[sampled] = self.batchSums[sampled] / counts[sampled]
+
+        confIntv = numpy.sqrt(math.log(2/self.delta) / (2*(counts + 0.01)))
+        confIntv *= (maxY - minY)
+
+        lowFunc = numpy.clip(func - confIntv, minY, maxY)
+        highFunc = numpy.clip(func + confIntv, minY, maxY)
         return (lowFunc, func, highFunc)